@@ -9,6 +9,13 @@ from pathlib import Path
 # Add the project root to Python path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+def _stat(path):
+    """Stat a path once, returning None when it doesn't exist"""
+    try:
+        return os.stat(path)
+    except FileNotFoundError:
+        return None
+
 def check_database_persistence():
     print("=== DATABASE PERSISTENCE DEBUG ===")
     
@@ -24,33 +31,39 @@ def check_database_persistence():
     # Determine database path
     if is_render:
         db_dir = Path(os.environ.get("DB_DIR", "/var/data"))
-        if not db_dir.exists():
+        dir_stat = _stat(db_dir)
+        if dir_stat is None:
             db_dir = Path("/opt/render/project")
-        print(f"Render DB directory: {db_dir}")
-        print(f"Render DB directory exists: {db_dir.exists()}")
-        print(f"Render DB directory is writable: {os.access(db_dir, os.W_OK) if db_dir.exists() else False}")
+            dir_stat = _stat(db_dir)
+        label = "Render"
     else:
         db_dir = Path(os.environ.get("DB_DIR", Path.cwd()))
-        print(f"Local DB directory: {db_dir}")
-        print(f"Local DB directory exists: {db_dir.exists()}")
-        print(f"Local DB directory is writable: {os.access(db_dir, os.W_OK) if db_dir.exists() else False}")
+        dir_stat = _stat(db_dir)
+        label = "Local"
+    print(f"{label} DB directory: {db_dir}")
+    print(f"{label} DB directory exists: {dir_stat is not None}")
+    print(f"{label} DB directory is writable: {os.access(db_dir, os.W_OK) if dir_stat else False}")
     
     # Check database file
     db_path = db_dir / "app.db"
+    db_stat = _stat(db_path)
     print(f"Database file path: {db_path}")
-    print(f"Database file exists: {db_path.exists()}")
-    print(f"Database file size: {db_path.stat().st_size if db_path.exists() else 'N/A'} bytes")
+    print(f"Database file exists: {db_stat is not None}")
+    print(f"Database file size: {db_stat.st_size if db_stat else 'N/A'} bytes")
     
     # Check if it's a persistent mount
     if is_render:
-        print(f"Mount point /var/data exists: {Path('/var/data').exists()}")
-        print(f"Mount point /var/data is writable: {os.access('/var/data', os.W_OK) if Path('/var/data').exists() else False}")
+        mount_stat = dir_stat if str(db_dir) == '/var/data' else _stat('/var/data')
+        print(f"Mount point /var/data exists: {mount_stat is not None}")
+        print(f"Mount point /var/data is writable: {os.access('/var/data', os.W_OK) if mount_stat else False}")
         
         # Check if it's actually mounted
         try:
-            import subprocess
-            result = subprocess.run(['mount'], capture_output=True, text=True)
-            if '/var/data' in result.stdout:
+            # Read the kernel's mount table directly instead of forking mount(8);
+            # the fifth field of each mountinfo line is the mount point
+            with open('/proc/self/mountinfo') as f:
+                mounted = any(line.split()[4] == '/var/data' for line in f)
+            if mounted:
                 print("✅ /var/data is mounted as a persistent disk")
             else:
                 print("❌ /var/data is NOT mounted as a persistent disk")
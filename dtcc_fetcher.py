@@ -14,6 +14,7 @@ import math
 from datetime import datetime
 from typing import Dict, List, Set, Optional
 import threading
+from concurrent.futures import ThreadPoolExecutor
 import signal
 import sys
 import pandas as pd
@@ -39,6 +40,7 @@ CSV_FILE_NAME = "dtcc_trades.csv"
 FETCH_INTERVAL = 60  # seconds
 MAX_RETRIES = 3
 REQUEST_TIMEOUT = 30
+MAX_CONCURRENT_FETCHES = 8  # Sources are polled in parallel, up to this many at once
 
 class DTCCFetcher:
     def __init__(self, csv_file: str = CSV_FILE_NAME):
@@ -134,12 +136,16 @@ class DTCCFetcher:
                 return None
     
     def fetch_all_sources(self) -> Dict[str, List[Dict]]:
-        """Fetch trade data from all DTCC API sources"""
+        """Fetch trade data from all DTCC API sources concurrently"""
         all_trades = {}
         
-        for source in DTCC_API_URLS.keys():
+        # Fetches are network-bound, so overlap them instead of waiting on each source in turn
+        with ThreadPoolExecutor(max_workers=min(MAX_CONCURRENT_FETCHES, len(DTCC_API_URLS))) as executor:
+            futures = {source: executor.submit(self.fetch_trade_data, source) for source in DTCC_API_URLS}
+        
+        for source, future in futures.items():
             try:
-                data = self.fetch_trade_data(source)
+                data = future.result()
                 if data and 'tradeList' in data:
                     all_trades[source] = data['tradeList']
                 else:
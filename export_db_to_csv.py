@@ -10,16 +10,32 @@ import sys
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
 
 from src.models.trade_data import db, TradeRecord
-from flask import Flask
-import pandas as pd
+from export_trade_history import create_app, native_csv_export, native_select_sql, row_formatter, stream_query_to_csv
+from sqlalchemy import func, select
 
-def create_app():
-    """Create Flask app for database access"""
-    app = Flask(__name__)
-    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'src', 'database', 'app.db')}"
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-    db.init_app(app)
-    return app
+# Column name in trade_records -> header used in the exported CSV
+EXPORT_COLUMNS = [
+    ('trade_time', 'Trade Time'),
+    ('effective_date', 'Effective Date'),
+    ('expiration_date', 'Expiration Date'),
+    ('tenor', 'Tenor'),
+    ('currency', 'Currency'),
+    ('rates', 'Rates'),
+    ('notionals', 'Notionals'),
+    ('dv01', 'Dv01'),
+    ('frequency', 'Frequency'),
+    ('action_type', 'Action Type'),
+    ('event_type', 'Event Type'),
+    ('asset_class', 'Asset Class'),
+    ('upi_underlier_name', 'UPI Underlier Name'),
+    ('unique_product_identifier', 'Unique Product Identifier'),
+    ('dissemination_identifier', 'Dissemination Identifier'),
+    ('other_payment_type', 'Other Payment Type'),
+    ('created_at', 'Created At'),
+]
+
+# Same ISO date formatting as the other exports
+_format_row = row_formatter([TradeRecord.__table__.c[col] for col, _ in EXPORT_COLUMNS])
 
 def export_database_to_csv():
     """Export database to CSV"""
@@ -27,42 +43,23 @@ def export_database_to_csv():
     
     with app.app_context():
         try:
-            # Get all trade records from database
-            trade_records = TradeRecord.query.order_by(TradeRecord.trade_time.desc()).all()
-            
-            if not trade_records:
+            exported = db.session.execute(select(func.count()).select_from(TradeRecord)).scalar()
+            if not exported:
                 print("No trade records to export")
                 return
             
-            # Convert to list of dictionaries
-            trade_data = []
-            for record in trade_records:
-                trade_data.append({
-                    'Trade Time': record.trade_time.isoformat() if record.trade_time else '',
-                    'Effective Date': record.effective_date.isoformat() if record.effective_date else '',
-                    'Expiration Date': record.expiration_date.isoformat() if record.expiration_date else '',
-                    'Tenor': record.tenor,
-                    'Currency': record.currency,
-                    'Rates': record.rates,
-                    'Notionals': record.notionals,
-                    'Dv01': record.dv01,
-                    'Frequency': record.frequency,
-                    'Action Type': record.action_type,
-                    'Event Type': record.event_type,
-                    'Asset Class': record.asset_class,
-                    'UPI Underlier Name': record.upi_underlier_name,
-                    'Unique Product Identifier': record.unique_product_identifier,
-                    'Dissemination Identifier': record.dissemination_identifier,
-                    'Other Payment Type': record.other_payment_type,
-                    'Created At': record.created_at.isoformat() if record.created_at else ''
-                })
-            
-            # Create DataFrame and save to CSV
-            df = pd.DataFrame(trade_data)
+            sql = native_select_sql(TradeRecord.__table__, EXPORT_COLUMNS, 'trade_time')
             csv_path = os.path.join('src', 'trade_data.csv')
-            df.to_csv(csv_path, index=False)
             
-            print(f"✅ Exported {len(trade_records)} trade records to {csv_path}")
+            # Prefer the database's native CSV export; otherwise stream rows
+            # through a server-side cursor instead of hydrating ORM objects
+            if not native_csv_export(sql, csv_path):
+                stmt = select(
+                    *(getattr(TradeRecord, col) for col, _ in EXPORT_COLUMNS)
+                ).order_by(TradeRecord.trade_time.desc())
+                stream_query_to_csv(stmt, [header for _, header in EXPORT_COLUMNS], csv_path, _format_row)
+            
+            print(f"✅ Exported {exported} trade records to {csv_path}")
             
         except Exception as e:
             print(f"❌ Error exporting trade data to CSV: {e}")
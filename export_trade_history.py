@@ -5,168 +5,424 @@ Export raw trade history from database to CSV
 
 import os
 import sys
-import pandas as pd
-from datetime import datetime
+import csv
+import gzip
+import io
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import shutil
+import subprocess
+from datetime import datetime, date
 
 # Add the src directory to the path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
 
 from src.models.trade_data import db, TradeRecord, StructuredTrade, Commentary, ProcessingLog
 from flask import Flask
+from sqlalchemy import Date, DateTime, event, func, select
 
+@functools.cache
 def create_app():
-    """Create Flask app for database access"""
+    """Create Flask app for database access (built once per process)"""
     app = Flask(__name__)
     app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'src', 'database', 'app.db')}"
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     db.init_app(app)
+    
+    # Large page cache + mmap for the full-table scans behind each export
+    with app.app_context():
+        @event.listens_for(db.engine, "connect")
+        def _sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA cache_size=-262144;")
+            cursor.execute("PRAGMA mmap_size=1073741824;")
+            cursor.execute("PRAGMA temp_store=MEMORY;")
+            cursor.close()
+        
+        _prefetch_database_file(db.engine.url)
+    
     return app
 
-def export_trade_records():
-    """Export raw trade records to CSV"""
-    app = create_app()
+def _prefetch_database_file(url):
+    """Ask the kernel to start reading the SQLite file ahead of the export scans"""
+    if not hasattr(os, 'posix_fadvise') or url.get_backend_name() != 'sqlite' or not url.database:
+        return
+    try:
+        fd = os.open(url.database, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        # Readahead hints are per file descriptor, so SEQUENTIAL alone would not reach
+        # SQLite's own handle; WILLNEED queues the file into the shared page cache.
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    finally:
+        os.close(fd)
+
+EXPORT_BATCH_SIZE = 10_000
+EXPORT_BUFFER_SIZE = 1 << 20  # 1 MiB write buffer for export files
+EXPORT_FADVISE_CHUNK = 64 << 20  # Drop written pages from the page cache every 64 MiB
+
+# File suffix added for each --compress choice
+COMPRESSION_SUFFIXES = {'none': '', 'gzip': '.gz', 'zstd': '.zst'}
+
+def open_export_file(filename, compression='none'):
+    """Open an export file for binary writing, compressing inline at a fast level"""
+    if compression == 'gzip':
+        return gzip.open(filename, 'wb', compresslevel=1)
+    if compression == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor(level=1).stream_writer(open(filename, 'wb', buffering=EXPORT_BUFFER_SIZE))
+    return open(filename, 'wb', buffering=EXPORT_BUFFER_SIZE)
+
+def _drop_cached_pages(f):
+    """Tell the kernel the already-written part of an export file won't be re-read.
+    
+    DONTNEED leaves dirty pages in the cache, so the data is synced to disk first.
+    """
+    if hasattr(os, 'posix_fadvise'):
+        f.flush()
+        fd = f.fileno()
+        os.fdatasync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+class _PageDroppingWriter:
+    """Write-only wrapper around an export file that drops its pages every EXPORT_FADVISE_CHUNK bytes"""
+    
+    def __init__(self, f):
+        self._f = f
+        self._written = 0
+        self._next_drop = EXPORT_FADVISE_CHUNK
+    
+    def write(self, data):
+        written = self._f.write(data)
+        self._written += len(data)
+        if self._written >= self._next_drop:
+            _drop_cached_pages(self._f)
+            self._next_drop += EXPORT_FADVISE_CHUNK
+        return written
+
+def _iso_datetime_sql(column, backend):
+    """SQL rendering a DateTime column as datetime.isoformat() does, e.g. 2025-10-02T10:34:09"""
+    if backend == 'postgresql':
+        return (
+            f"to_char({column}, 'YYYY-MM-DD\"T\"HH24:MI:SS') || CASE WHEN "
+            f"date_part('microseconds', {column})::int % 1000000 = 0 THEN '' ELSE to_char({column}, '.US') END"
+        )
+    # SQLite stores 'YYYY-MM-DD HH:MM:SS.ffffff'; isoformat() leaves out a zero fraction
+    return (
+        f"CASE WHEN {column} LIKE '%.000000' THEN replace(substr({column}, 1, 19), ' ', 'T') "
+        f"ELSE replace({column}, ' ', 'T') END"
+    )
+
+def native_select_sql(table, columns, order_col=None):
+    """SELECT for native_csv_export over (column name, header) pairs.
+    
+    DateTime columns are formatted in SQL so the native CSV matches the streamed
+    export instead of the database's storage format.
+    """
+    backend = db.engine.url.get_backend_name()
+    select_list = ', '.join(
+        f'{_iso_datetime_sql(name, backend) if isinstance(table.c[name].type, DateTime) else name} AS "{header}"'
+        for name, header in columns
+    )
+    sql = f"SELECT {select_list} FROM {table.name}"
+    if order_col:
+        sql += f" ORDER BY {order_col} DESC"
+    return sql
+
+def native_csv_export(sql, filename, compression='none'):
+    """Export a query using the database's own CSV writer.
+    
+    Uses the sqlite3 CLI for SQLite and COPY ... TO STDOUT for PostgreSQL.
+    Returns False when no native path is available so callers can fall back.
+    """
+    url = db.engine.url
+    backend = url.get_backend_name()
+    try:
+        if backend == 'sqlite':
+            sqlite_cli = shutil.which('sqlite3')
+            if not sqlite_cli or not url.database:
+                return False
+            command = [sqlite_cli, '-csv', '-header', url.database, sql]
+            # Pipe the CLI output through (the compressor and) the page-dropping writer
+            with open_export_file(filename, compression) as f:
+                with subprocess.Popen(command, stdout=subprocess.PIPE) as proc:
+                    shutil.copyfileobj(proc.stdout, _PageDroppingWriter(f), EXPORT_BUFFER_SIZE)
+                if proc.returncode:
+                    raise subprocess.CalledProcessError(proc.returncode, command)
+                _drop_cached_pages(f)
+            return True
+        
+        if backend == 'postgresql':
+            conn = db.engine.raw_connection()
+            try:
+                with conn.cursor() as cur, open_export_file(filename, compression) as f:
+                    cur.copy_expert(f"COPY ({sql}) TO STDOUT WITH CSV HEADER", _PageDroppingWriter(f))
+                    _drop_cached_pages(f)
+            finally:
+                conn.close()
+            return True
+    except Exception as e:
+        print(f"Native export failed, falling back to streamed export: {e}")
+    
+    return False
+
+# Effective/expiration dates and created_at batches repeat across many rows
+@functools.lru_cache(maxsize=8192)
+def _iso(value):
+    return value.isoformat() if value else ''
+
+def _passthrough(value):
+    return value
+
+def row_formatter(columns):
+    """format_row for stream_query_to_csv: ISO-format dates, blank for missing ones.
+    
+    One formatter per column is resolved here instead of per row.
+    """
+    formatters = tuple(_iso if isinstance(column.type, (Date, DateTime)) else _passthrough for column in columns)
+    
+    def format_row(row):
+        return tuple([fmt(value) for fmt, value in zip(formatters, row)])
+    
+    return format_row
+
+def stream_query_to_csv(stmt, header, filename, format_row=None, compression='none'):
+    """Write a select() to CSV through a server-side cursor, returning the row count
+    
+    format_row, when given, maps each row tuple to the values written for it.
+    """
+    result = db.session.execute(
+        stmt.execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE)
+    )
+    
+    written = 0
+    with io.TextIOWrapper(open_export_file(filename, compression), newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        next_drop = EXPORT_FADVISE_CHUNK
+        for partition in result.partitions():
+            writer.writerows(map(format_row, partition) if format_row else partition)
+            written += len(partition)
+            if f.buffer.tell() >= next_drop:
+                _drop_cached_pages(f)
+                next_drop += EXPORT_FADVISE_CHUNK
+        _drop_cached_pages(f)
+    
+    return written
+
+def stream_query_to_parquet(stmt, header, filename, compression='none'):
+    """Write a select() to Parquet in record batches, returning the row count"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    arrow_types = {
+        int: pa.int64(),
+        float: pa.float64(),
+        str: pa.string(),
+        bool: pa.bool_(),
+        datetime: pa.timestamp('us'),
+        date: pa.date32(),
+    }
+    schema = pa.schema([
+        (name, arrow_types.get(column.type.python_type, pa.string()))
+        for name, column in zip(header, stmt.selected_columns)
+    ])
+    
+    result = db.session.execute(
+        stmt.execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE)
+    )
+    
+    written = 0
+    # Parquet compresses per column chunk, so --compress picks the codec instead of wrapping the file
+    codec = 'snappy' if compression == 'none' else compression
+    with pq.ParquetWriter(filename, schema, compression=codec) as writer:
+        for partition in result.partitions():
+            arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*partition), schema)]
+            writer.write_batch(pa.record_batch(arrays, schema=schema))
+            written += len(partition)
+    
+    return written
+
+def _export_table(model, filename, order_col=None, export_format='csv', compression='none'):
+    """Export a whole table to CSV or Parquet, returning the number of rows written"""
+    row_count = db.session.execute(select(func.count()).select_from(model.__table__)).scalar()
+    if not row_count:
+        return 0
+    
+    stmt = select(model.__table__)
+    if order_col:
+        stmt = stmt.order_by(model.__table__.c[order_col].desc())
+    
+    if export_format == 'parquet':
+        return stream_query_to_parquet(stmt, _columns(model), filename, compression)
+    
+    sql = native_select_sql(model.__table__, [(name, name) for name in _columns(model)], order_col)
+    if native_csv_export(sql, filename, compression):
+        return row_count
+    
+    # Fallback: stream rows in constant memory instead of materializing the table
+    return stream_query_to_csv(stmt, _columns(model), filename, row_formatter(stmt.selected_columns), compression)
+
+def _export_extension(export_format, compression):
+    """File extension for an export; compressed CSVs get a .gz/.zst suffix"""
+    suffix = COMPRESSION_SUFFIXES[compression] if export_format == 'csv' else ''
+    return f"{export_format}{suffix}"
+
+def _export_filename(prefix, export_format, compression):
+    return f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{_export_extension(export_format, compression)}"
+
+def _report(lines):
+    """Write an exporter's summary in one call so concurrent exporters don't interleave"""
+    sys.stdout.write('\n'.join(lines) + '\n')
+
+def _columns(model):
+    return [column.name for column in model.__table__.columns]
+
+def _value_counts(column):
+    """GROUP BY equivalent of pandas value_counts(), most frequent first"""
+    count = func.count()
+    return dict(db.session.execute(select(column, count).group_by(column).order_by(count.desc())).all())
+
+def export_trade_records(app=None, export_format='csv', compression='none'):
+    """Export raw trade records to CSV or Parquet"""
+    app = app or create_app()
     
     with app.app_context():
-        # Query all trade records
-        trade_records = TradeRecord.query.all()
+        filename = _export_filename('raw_trade_history', export_format, compression)
+        row_count = _export_table(TradeRecord, filename, export_format=export_format, compression=compression)
         
-        if not trade_records:
+        if not row_count:
             print("No trade records found in database")
             return False
         
-        # Convert to list of dictionaries
-        data = [record.to_dict() for record in trade_records]
-        
-        # Create DataFrame
-        df = pd.DataFrame(data)
-        
-        # Export to CSV
-        filename = f"raw_trade_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        df.to_csv(filename, index=False)
+        # Summaries come from SQL aggregates since the rows never pass through Python
+        min_time, max_time = db.session.execute(
+            select(func.min(TradeRecord.trade_time), func.max(TradeRecord.trade_time))
+        ).one()
+        currencies = db.session.execute(select(TradeRecord.currency).distinct()).scalars().all()
         
-        print(f"Exported {len(trade_records)} trade records to {filename}")
-        print(f"Columns: {list(df.columns)}")
-        print(f"Date range: {df['trade_time'].min()} to {df['trade_time'].max()}")
-        print(f"Currencies: {df['currency'].unique()}")
+        _report([
+            f"Exported {row_count} trade records to {filename}",
+            f"Columns: {_columns(TradeRecord)}",
+            f"Date range: {min_time} to {max_time}",
+            f"Currencies: {currencies}",
+        ])
         
         return True
 
-def export_structured_trades():
-    """Export structured trades to CSV"""
-    app = create_app()
+def export_structured_trades(app=None, export_format='csv', compression='none'):
+    """Export structured trades to CSV or Parquet"""
+    app = app or create_app()
     
     with app.app_context():
-        # Query all structured trades
-        structured_trades = StructuredTrade.query.all()
+        filename = _export_filename('structured_trade_history', export_format, compression)
+        row_count = _export_table(StructuredTrade, filename, export_format=export_format, compression=compression)
         
-        if not structured_trades:
+        if not row_count:
             print("No structured trades found in database")
             return False
         
-        # Convert to list of dictionaries
-        data = [trade.to_dict() for trade in structured_trades]
-        
-        # Create DataFrame
-        df = pd.DataFrame(data)
+        structure_counts = _value_counts(StructuredTrade.structure)
         
-        # Export to CSV
-        filename = f"structured_trade_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        df.to_csv(filename, index=False)
-        
-        print(f"Exported {len(structured_trades)} structured trades to {filename}")
-        print(f"Columns: {list(df.columns)}")
-        print(f"Structures: {df['structure'].value_counts().to_dict()}")
+        _report([
+            f"Exported {row_count} structured trades to {filename}",
+            f"Columns: {_columns(StructuredTrade)}",
+            f"Structures: {structure_counts}",
+        ])
         
         return True
 
-def export_commentaries():
-    """Export commentaries to CSV"""
-    app = create_app()
+def export_commentaries(app=None, export_format='csv', compression='none'):
+    """Export commentaries to CSV or Parquet"""
+    app = app or create_app()
     
     with app.app_context():
-        # Query all commentaries
-        commentaries = Commentary.query.all()
+        filename = _export_filename('commentary_history', export_format, compression)
+        row_count = _export_table(Commentary, filename, export_format=export_format, compression=compression)
         
-        if not commentaries:
+        if not row_count:
             print("No commentaries found in database")
             return False
         
-        # Convert to list of dictionaries
-        data = [commentary.to_dict() for commentary in commentaries]
+        currencies = db.session.execute(select(Commentary.currency).distinct()).scalars().all()
         
-        # Create DataFrame
-        df = pd.DataFrame(data)
-        
-        # Export to CSV
-        filename = f"commentary_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        df.to_csv(filename, index=False)
-        
-        print(f"Exported {len(commentaries)} commentaries to {filename}")
-        print(f"Columns: {list(df.columns)}")
-        print(f"Currencies: {df['currency'].unique()}")
+        _report([
+            f"Exported {row_count} commentaries to {filename}",
+            f"Columns: {_columns(Commentary)}",
+            f"Currencies: {currencies}",
+        ])
         
         return True
 
-def export_processing_logs():
-    """Export processing logs to CSV"""
-    app = create_app()
+def export_processing_logs(app=None, export_format='csv', compression='none'):
+    """Export processing logs to CSV or Parquet"""
+    app = app or create_app()
     
     with app.app_context():
-        # Query all processing logs
-        logs = ProcessingLog.query.all()
+        filename = _export_filename('processing_logs', export_format, compression)
+        row_count = _export_table(ProcessingLog, filename, export_format=export_format, compression=compression)
         
-        if not logs:
+        if not row_count:
             print("No processing logs found in database")
             return False
         
-        # Convert to list of dictionaries
-        data = [log.to_dict() for log in logs]
-        
-        # Create DataFrame
-        df = pd.DataFrame(data)
+        status_counts = _value_counts(ProcessingLog.status)
         
-        # Export to CSV
-        filename = f"processing_logs_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        df.to_csv(filename, index=False)
-        
-        print(f"Exported {len(logs)} processing logs to {filename}")
-        print(f"Columns: {list(df.columns)}")
-        print(f"Status counts: {df['status'].value_counts().to_dict()}")
+        _report([
+            f"Exported {row_count} processing logs to {filename}",
+            f"Columns: {_columns(ProcessingLog)}",
+            f"Status counts: {status_counts}",
+        ])
         
         return True
 
 def main():
     """Main export function"""
-    print("=== DTCC Trade History Export ===")
-    print(f"Exporting at: {datetime.now()}")
-    print()
+    parser = argparse.ArgumentParser(description="Export trade history from the database.")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv", help="Output file format")
+    parser.add_argument("--compress", choices=list(COMPRESSION_SUFFIXES), default="none", help="Compress output files inline")
+    args = parser.parse_args()
     
-    # Export all data types
-    success = True
+    if args.format == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            print("❌ Parquet export requires pyarrow (pip install pyarrow)")
+            return
     
-    print("1. Exporting raw trade records...")
-    if not export_trade_records():
-        success = False
+    if args.compress == 'zstd' and args.format == 'csv':
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            print("❌ zstd compression requires zstandard (pip install zstandard)")
+            return
     
-    print("\n2. Exporting structured trades...")
-    if not export_structured_trades():
-        success = False
+    print("=== DTCC Trade History Export ===")
+    print(f"Exporting at: {datetime.now()}")
+    print()
     
-    print("\n3. Exporting commentaries...")
-    if not export_commentaries():
-        success = False
+    # One app (and connection pool) shared by every exporter
+    app = create_app()
     
-    print("\n4. Exporting processing logs...")
-    if not export_processing_logs():
-        success = False
+    # The four tables are independent, so export them concurrently; each
+    # worker opens its own app context and pooled connection
+    exporters = (export_trade_records, export_structured_trades, export_commentaries, export_processing_logs)
+    print("Exporting raw trade records, structured trades, commentaries and processing logs...")
+    with ThreadPoolExecutor(max_workers=len(exporters)) as executor:
+        futures = [executor.submit(exporter, app, args.format, args.compress) for exporter in exporters]
+        success = all([future.result() for future in futures])
     
     if success:
         print("\n✅ All exports completed successfully!")
+        extension = _export_extension(args.format, args.compress)
         print("\nGenerated files:")
-        print("- raw_trade_history_*.csv (Raw trade data from DTCC API)")
-        print("- structured_trade_history_*.csv (Analyzed trade structures)")
-        print("- commentary_history_*.csv (Generated market commentaries)")
-        print("- processing_logs_*.csv (System processing logs)")
+        print(f"- raw_trade_history_*.{extension} (Raw trade data from DTCC API)")
+        print(f"- structured_trade_history_*.{extension} (Analyzed trade structures)")
+        print(f"- commentary_history_*.{extension} (Generated market commentaries)")
+        print(f"- processing_logs_*.{extension} (System processing logs)")
     else:
         print("\n❌ Some exports failed. Check the messages above.")
 
@@ -5,8 +5,10 @@ Replicates the combined functionality of IRSTradeParser.py and IRSTradeAnalysis.
 for DTCC trade data from DTCCParser.py output
 """
 
+import os
 import pandas as pd
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from itertools import combinations
 from collections import defaultdict
@@ -17,100 +19,123 @@ import logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Tenor in a UPI name, e.g. "5Y" or "10YR" (the Y pattern also covers YR)
+_RE_TENOR_Y = re.compile(r'(\d+)Y')
+
+# Formatting characters stripped from DTCC numeric fields
+_RE_NUMERIC_NOISE = re.compile(r'[,+$%]')
+
+# Input columns the analysis reads; everything else in the trade CSV is skipped
+INPUT_COLUMNS = {
+    'Trade Time', 'Effective Date', 'Expiration Date', 'Currency', 'Rates', 'Notionals', 'Dv01',
+    'UPI Underlier Name', 'Package Price', 'Other Payment Type',
+}
+INPUT_DTYPES = {'Currency': str, 'UPI Underlier Name': str, 'Other Payment Type': str}
+INPUT_DATE_COLUMNS = ['Trade Time', 'Effective Date', 'Expiration Date']
+
+# Per-leg columns of structured_output: tuples for packages, plain floats for single trades
+LEG_COLUMNS = ['Rates', 'Notionals', 'DV01s']
+
+# Rows per block when writing the structured output CSV
+OUTPUT_CSV_CHUNKSIZE = 100000
+
+# Structured rows below which commentary is generated serially: per-currency commentary
+# takes milliseconds, so worker start-up and pickling each currency's rows would cost more
+PARALLEL_COMMENTARY_MIN_ROWS = 200_000
+
+# DV01 ratio ranges that any two legs of a valid spread/butterfly fall into, with a
+# little slack for rounding; candidates outside them are never built
+SPREAD_DV01_WINDOW = (0.95 * (1 - 1e-9), (1 + 1e-9) / 0.95)
+BUTTERFLY_DV01_WINDOW = (0.95 / 2 * (1 - 1e-9), 2 * (1 + 1e-9) / 0.95)
+
+# Trades executed together: same trade time (to the minute), start date and currency
+GROUP_COLUMNS = ['Trade Time', 'Effective Date', 'Currency']
+
 class DTCCAnalysis:
-    def __init__(self, input_file='trade_data.csv', output_file='structured_output.csv'):
+    def __init__(self, input_file='trade_data.csv', output_file='structured_output.csv', chunksize=None,
+                 output_format='csv'):
         self.input_file = input_file
         self.output_file = output_file
+        self.output_format = output_format  # 'csv' or 'parquet' (written next to output_file as .parquet)
+        self.chunksize = chunksize  # Rows per read_csv chunk for large inputs (None reads in one go)
         self.df = None
         self.structured_output = []
+        self._output_df = None  # structured_output as a DataFrame, built once for commentary
         
-    def clean_numeric_value(self, value):
-        """Clean and convert numeric values, handling DTCC-specific formatting"""
-        if pd.isna(value) or value == '' or value is None:
-            return 0.0
+    def clean_numeric_column(self, values):
+        """Clean and convert a column of numeric values, handling DTCC-specific formatting"""
+        if pd.api.types.is_numeric_dtype(values):
+            return values.astype(np.float64).fillna(0.0)
         
-        try:
-            str_value = str(value).strip()
-            str_value = str_value.replace(',', '')    # Remove commas
-            str_value = str_value.replace('+', '')    # Remove plus signs
-            str_value = str_value.replace('$', '')    # Remove dollar signs
-            str_value = str_value.replace('%', '')    # Remove percent signs
-            
-            if str_value == '' or str_value == 'nan':
-                return 0.0
-            
-            return float(str_value)
-        except (ValueError, TypeError):
-            logger.warning(f"Could not convert value to float: {value}, returning 0.0")
-            return 0.0
-    
-    def extract_tenor(self, row):
-        """Extract tenor from DTCC data (UPI name or calculate from dates)"""
-        # Try UPI Underlier Name first
-        upi = str(row.get('UPI Underlier Name', ''))
-        
-        # Look for patterns like "5Y", "10Y", etc.
-        tenor_match = re.search(r'(\d+)Y', upi.upper())
-        if tenor_match:
-            return f"{tenor_match.group(1)}Y"
-        
-        # Look for patterns like "5YR", "10YR", etc.
-        tenor_match = re.search(r'(\d+)YR', upi.upper())
-        if tenor_match:
-            return f"{tenor_match.group(1)}Y"
-        
-        # Calculate from dates
-        try:
-            start = pd.to_datetime(row['Effective Date'])
-            end = pd.to_datetime(row['Expiration Date'])
-            years = (end - start).days / 365.25
-            
-            if years < 1.0:
-                # For trades less than 1 year, show months
-                months = int(round(years * 12))
-                return f"{months}M"
-            else:
-                # For trades 1 year or more, show years
-                return f"{int(round(years))}Y"
-        except:
-            return "Unknown"
-    
-    def get_imm_code(self, date):
-        """Get IMM code for date (H, M, U, Z + year)"""
-        imm_months = {3: 'H', 6: 'M', 9: 'U', 12: 'Z'}
-        if date.month in imm_months and 15 <= date.day <= 21 and date.weekday() == 2:
-            year = str(date.year)[-1]
-            return f"{imm_months[date.month]}{year}"
-        return None
-    
-    def get_effective_bucket(self, start_date, today):
-        """Convert start date to market convention (Spot, IMM, 1Y, etc.)"""
-        delta_days = (start_date - today).days
-        
-        if abs(delta_days) <= 5:
-            return "Spot"
-        
-        # Check for IMM dates
-        imm_code = self.get_imm_code(start_date)
-        if imm_code:
-            return imm_code
-        
-        # Check for standard periods
-        months_delta = round(delta_days / 30.4375)  # average days per month
-        if abs(months_delta - 6) <= 1:
-            return "6M"
-        if abs(months_delta - 9) <= 1:
-            return "9M"
-        if abs(months_delta - 12) <= 1:
-            return "1Y"
-        
-        # Check for yearly periods
+        # Remove commas, plus signs, dollar signs and percent signs
+        text = values.astype(str).str.strip().str.replace(_RE_NUMERIC_NOISE, '', regex=True)
+        numbers = pd.to_numeric(text, errors='coerce')
+        
+        unparsed = numbers.isna() & values.notna() & ~text.isin(['', 'nan'])
+        if unparsed.any():
+            logger.warning(
+                f"Could not convert {int(unparsed.sum())} values to float "
+                f"(e.g. {values[unparsed].iloc[0]}), using 0.0"
+            )
+        
+        return numbers.astype(np.float64).fillna(0.0)
+    
+    def extract_tenors(self, df):
+        """Extract tenors for every row (UPI name first, otherwise calculated from dates)"""
+        # Look for patterns like "5Y", "10Y", "5YR", "10YR"
+        upi = df['UPI Underlier Name'] if 'UPI Underlier Name' in df else pd.Series('', index=df.index)
+        upi_years = upi.astype(str).str.upper().str.extract(_RE_TENOR_Y, expand=False)
+        
+        # Calculate from dates: months under 1 year, whole years otherwise
+        years = ((df['Expiration Date'] - df['Effective Date']).dt.days / 365.25).to_numpy()
+        known = ~np.isnan(years)
+        months = np.rint(np.where(known, years * 12, 0)).astype(np.int64).astype(str)
+        whole_years = np.rint(np.where(known, years, 0)).astype(np.int64).astype(str)
+        from_dates = np.where(
+            ~known, 'Unknown',
+            np.where(years < 1.0, np.char.add(months, 'M'), np.char.add(whole_years, 'Y'))
+        )
+        
+        return pd.Series(
+            np.where(upi_years.notna(), upi_years.fillna('') + 'Y', from_dates).astype(object),
+            index=df.index
+        )
+    
+    def get_effective_buckets(self, start_dates, today):
+        """Convert start dates to market convention (Spot, IMM, 1Y, etc.)"""
+        delta_days = (start_dates - today).dt.days.to_numpy()
+        
+        # IMM dates: Wednesday between the 15th and 21st of Mar/Jun/Sep/Dec (H, M, U, Z + year)
+        imm_months = start_dates.dt.month.map({3: 'H', 6: 'M', 9: 'U', 12: 'Z'})
+        is_imm = (
+            imm_months.notna()
+            & start_dates.dt.day.between(15, 21)
+            & (start_dates.dt.dayofweek == 2)
+        ).to_numpy()
+        imm_codes = (imm_months.fillna('') + (start_dates.dt.year % 10).astype(str)).to_numpy(object)
+        
+        # Standard periods (average days per month) and yearly periods
+        months_delta = np.rint(delta_days / 30.4375)
         rel_years = delta_days / 365.25
-        for y in range(1, 11):
-            if abs(rel_years - y) <= 0.2:
-                return f"{y}Y"
+        nearest_year = np.rint(rel_years)
+        is_yearly = (nearest_year >= 1) & (nearest_year <= 10) & (np.abs(rel_years - nearest_year) <= 0.2)
+        yearly_codes = np.char.add(np.nan_to_num(nearest_year).astype(np.int64).astype(str), 'Y').astype(object)
         
-        return start_date.strftime('%Y-%m-%d')
+        # First matching condition wins, in the same priority order as the market convention
+        buckets = np.select(
+            [
+                np.abs(delta_days) <= 5,
+                is_imm,
+                np.abs(months_delta - 6) <= 1,
+                np.abs(months_delta - 9) <= 1,
+                np.abs(months_delta - 12) <= 1,
+                is_yearly,
+            ],
+            [np.array('Spot', dtype=object), imm_codes, np.array('6M', dtype=object),
+             np.array('9M', dtype=object), np.array('1Y', dtype=object), yearly_codes],
+            default=start_dates.dt.strftime('%Y-%m-%d').to_numpy(object)
+        )
+        return pd.Series(buckets, index=start_dates.index)
     
     def tenor_key(self, tenor):
         """Convert tenor to numeric key for sorting"""
@@ -119,6 +144,11 @@ class DTCCAnalysis:
         except:
             return float('inf')
     
+    def tenor_keys(self, tenors):
+        """Vectorized tenor_key for a whole column of tenors"""
+        keys = pd.to_numeric(tenors.str.strip('Y').str.replace('M', '0'), errors='coerce')
+        return keys.fillna(float('inf')).astype(np.float64)
+    
     def compute_metric(self, structure, rates):
         """Calculate spread/butterfly metrics in basis points"""
         try:
@@ -130,57 +160,103 @@ class DTCCAnalysis:
             return ''
         return ''
     
-    def valid_spread(self, dv01s, tenors):
-        """Validate if trades form a valid spread (DV01 neutral)"""
-        if len(set(tenors)) != 2 or len(dv01s) != 2 or 0 in dv01s:
-            return False
-        return 0.95 <= dv01s[0] / dv01s[1] <= 1.05
+    def valid_spreads(self, dv01s):
+        """Validate candidate spreads (DV01 neutral); one row of tenor-ordered DV01s per candidate"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = dv01s[:, 0] / dv01s[:, 1]
+        return ~(dv01s == 0).any(axis=1) & (0.95 <= ratio) & (ratio <= 1.05)
     
-    def valid_butterfly(self, dv01s, tenors):
-        """Validate if trades form a valid butterfly (DV01 neutral)"""
-        if len(set(tenors)) != 3 or len(dv01s) != 3 or 0 in dv01s:
-            return False
-        wings = sorted(dv01s)
-        return 0.95 <= wings[0] / wings[1] <= 1.05 and 0.95 <= wings[0] * 2 / wings[2] <= 1.05
+    def valid_butterflies(self, dv01s):
+        """Validate candidate butterflies (DV01 neutral); one row of three DV01s per candidate"""
+        wings = np.sort(dv01s, axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            near = wings[:, 0] / wings[:, 1]
+            far = wings[:, 0] * 2 / wings[:, 2]
+        return (
+            ~(dv01s == 0).any(axis=1)
+            & (0.95 <= near) & (near <= 1.05)
+            & (0.95 <= far) & (far <= 1.05)
+        )
+    
+    def _parquet_input(self):
+        """True when input_file is a Parquet file or dataset directory (DTCCParser's Parquet archive)"""
+        return os.path.isdir(self.input_file) or str(self.input_file).endswith('.parquet')
+    
+    def _read_parquet_input(self):
+        """Read the analysed columns of a Parquet input, with the same dtypes as the CSV path"""
+        import pyarrow.dataset as ds
+        dataset = ds.dataset(self.input_file, format='parquet', partitioning='hive')
+        columns = [name for name in dataset.schema.names if name in INPUT_COLUMNS]
+        df = dataset.to_table(columns=columns).to_pandas()
+        df = df.astype({column: object for column in INPUT_DTYPES if column in df})
+        # Empty strings are missing values, as read_csv treats empty fields
+        return df.mask(df == '')
+    
+    def _read_input(self, **kwargs):
+        """read_csv limited to the columns the analysis uses, with their dtypes fixed up front"""
+        return pd.read_csv(
+            self.input_file,
+            usecols=lambda column: column in INPUT_COLUMNS,
+            dtype=INPUT_DTYPES,
+            parse_dates=INPUT_DATE_COLUMNS,
+            **kwargs
+        )
+    
+    def _clean_chunk(self, df):
+        """Parse dates and numeric fields and drop unknown currencies for one block of rows"""
+        df['Trade Time'] = pd.to_datetime(df['Trade Time']).dt.floor('min')
+        df['Effective Date'] = pd.to_datetime(df['Effective Date'])
+        df['Expiration Date'] = pd.to_datetime(df['Expiration Date'], errors='coerce')
+        
+        # Clean numeric fields
+        df['Rate'] = self.clean_numeric_column(df['Rates'])
+        df['Notional'] = self.clean_numeric_column(df['Notionals'])
+        df['DV01(USD)'] = self.clean_numeric_column(df['Dv01'])
+        
+        # Clean Currency field - handle NaN values
+        df['Currency'] = df['Currency'].fillna('UNKNOWN')
+        return df.drop(index=df.index[df['Currency'] == 'UNKNOWN'])  # Remove records with unknown currency
     
     def load_and_prepare_data(self):
         """Load DTCC data and prepare for analysis"""
         try:
-            self.df = pd.read_csv(self.input_file)
-            logger.info(f"Loaded {len(self.df)} trades from {self.input_file}")
-            
-            # Clean and prepare data
-            self.df['Trade Time'] = pd.to_datetime(self.df['Trade Time']).dt.floor('min')
-            self.df['Effective Date'] = pd.to_datetime(self.df['Effective Date'])
-            self.df['Expiration Date'] = pd.to_datetime(self.df['Expiration Date'], errors='coerce')
-            
-            # Clean numeric fields
-            self.df['Rate'] = self.df['Rates'].apply(self.clean_numeric_value)
-            self.df['Notional'] = self.df['Notionals'].apply(self.clean_numeric_value)
-            self.df['DV01(USD)'] = self.df['Dv01'].apply(self.clean_numeric_value)
-            
-            # Clean Currency field - handle NaN values
-            self.df['Currency'] = self.df['Currency'].fillna('UNKNOWN')
-            self.df = self.df[self.df['Currency'] != 'UNKNOWN']  # Remove records with unknown currency
+            if self._parquet_input():
+                raw = self._read_parquet_input()
+                loaded = len(raw)
+                self.df = self._clean_chunk(raw)
+            elif self.chunksize:
+                # Clean each chunk as it is read so raw string columns never pile up
+                loaded = 0
+                chunks = []
+                for chunk in self._read_input(chunksize=self.chunksize):
+                    loaded += len(chunk)
+                    chunks.append(self._clean_chunk(chunk))
+                self.df = pd.concat(chunks, copy=False)
+            else:
+                raw = self._read_input()
+                loaded = len(raw)
+                self.df = self._clean_chunk(raw)
+            logger.info(f"Loaded {loaded} trades from {self.input_file}")
             
             # Extract tenors
-            self.df['T'] = self.df.apply(self.extract_tenor, axis=1)
+            self.df['T'] = self.extract_tenors(self.df)
+            self.df['T_key'] = self.tenor_keys(self.df['T'])
+            
+            # Low-cardinality labels as categoricals: grouping and tenor bucketing work on int codes
+            self.df['Currency'] = self.df['Currency'].astype('category')
+            self.df['T'] = self.df['T'].astype('category')
+            self.df['T_code'] = self.df['T'].cat.codes.to_numpy()
             
             # Calculate effective buckets
             today = pd.to_datetime(datetime.today().date())
-            self.df['Effective Bucket'] = self.df['Effective Date'].apply(
-                lambda d: self.get_effective_bucket(d, today)
-            )
+            self.df['Effective Bucket'] = self.get_effective_buckets(self.df['Effective Date'], today)
             
-            # Create grouping keys and trade IDs
+            # Create trade IDs (trades are grouped on GROUP_COLUMNS directly)
             self.df['Trade ID'] = self.df.index
-            self.df['Group Key'] = self.df.apply(
-                lambda row: f"{row['Trade Time']}|{row['Effective Date']}|{row['Currency']}", 
-                axis=1
-            )
             
             # Handle Other Pay Type
             self.df['Other Pay Type'] = self.df.get('Other Payment Type', '').fillna('')
+            self._cache_columns()
             
             logger.info("Data preparation completed")
             return True
@@ -189,112 +265,185 @@ class DTCCAnalysis:
             logger.error(f"Error loading data: {e}")
             return False
     
+    def _cache_columns(self):
+        """Keep the columns used by structure detection as flat arrays (struct-of-arrays)"""
+        df = self.df
+        self._tenor = df['T'].to_numpy(object)
+        self._tenor_code = df['T_code'].to_numpy()
+        self._tenor_key = df['T_key'].to_numpy(np.float64)
+        self._rate = df['Rate'].to_numpy(np.float64)
+        self._dv01 = df['DV01(USD)'].to_numpy(np.float64)
+        self._notional = df['Notional'].to_numpy(np.float64)
+        self._pay_type = df['Other Pay Type'].to_numpy(object)
+        self._trade_time = df['Trade Time'].to_numpy(object)
+        # Effective dates as int64 day numbers (NaT kept as a separate mask)
+        effective_days = df['Effective Date'].to_numpy('datetime64[D]')
+        self._effective_day = effective_days.astype(np.int64)
+        self._effective_nat = np.isnat(effective_days)
+        self._bucket = df['Effective Bucket'].to_numpy(object)
+        self._currency = df['Currency'].to_numpy(object)
+        self._expiration = df['Expiration Date'].to_numpy(object)
+        self._package_price = (
+            df['Package Price'].to_numpy(object) if 'Package Price' in df
+            else np.full(len(df), '', dtype=object)
+        )
+    
+    def _dv01_window(self, positions, window):
+        """Lowest and highest DV01 a matching leg may have, for each trade in `positions`"""
+        low, high = self._dv01[positions] * window[0], self._dv01[positions] * window[1]
+        return np.minimum(low, high), np.maximum(low, high)
+    
+    def _window_matches(self, lower, upper, positions):
+        """(row, position) pairs where the trade at `position` has a DV01 in [lower[row], upper[row]]"""
+        positions = positions[np.argsort(self._dv01[positions], kind='stable')]
+        dv01s = self._dv01[positions]
+        start = np.searchsorted(dv01s, lower, side='left')
+        counts = np.maximum(np.searchsorted(dv01s, upper, side='right') - start, 0)
+        
+        rows = np.repeat(np.arange(len(lower)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return rows, positions[start[rows] + offsets]
+    
+    def _cross_tenor_candidates(self, positions, size):
+        """Every `size` trades with distinct tenors among `positions`, in position order.
+        
+        Trades are bucketed by tenor and only combined across buckets, so same-tenor
+        candidates are never built. Each bucket is sorted by DV01 and only legs inside
+        the spread/butterfly DV01 ratio window of the legs already picked are joined on.
+        Sorting the result keeps the order a plain combinations() scan would visit them
+        in, which the greedy matching relies on.
+        """
+        by_tenor = defaultdict(list)
+        for p in positions:
+            by_tenor[self._tenor_code[p]].append(p)
+        by_tenor = {code: np.array(bucket, dtype=np.int64) for code, bucket in by_tenor.items()}
+        window = BUTTERFLY_DV01_WINDOW if size == 3 else SPREAD_DV01_WINDOW
+        
+        blocks = []
+        for tenors in combinations(by_tenor, size):
+            first = by_tenor[tenors[0]]
+            lower, upper = self._dv01_window(first, window)
+            rows, second = self._window_matches(lower, upper, by_tenor[tenors[1]])
+            if size == 2:
+                blocks.append(np.stack([first[rows], second], axis=1))
+                continue
+            
+            # The third leg has to sit inside the windows of both legs picked so far
+            second_lower, second_upper = self._dv01_window(second, window)
+            rows_3, third = self._window_matches(
+                np.maximum(lower[rows], second_lower), np.minimum(upper[rows], second_upper), by_tenor[tenors[2]]
+            )
+            blocks.append(np.stack([first[rows][rows_3], second[rows_3], third], axis=1))
+        
+        if not blocks:
+            return np.empty((0, size), dtype=np.int64)
+        
+        candidates = np.sort(np.concatenate(blocks), axis=1)
+        return candidates[np.lexsort(candidates.T[::-1])]
+    
+    def _valid_candidates(self, positions, size):
+        """Cross-tenor candidates that pass the DV01-neutrality check, checked as whole arrays"""
+        candidates = self._cross_tenor_candidates(positions, size)
+        dv01s = self._dv01[candidates]
+        if size == 3:
+            return candidates[self.valid_butterflies(dv01s)]
+        
+        # Spread ratios are taken in tenor order (ties keep record order, as the stable sort does)
+        keys = self._tenor_key[candidates]
+        dv01s = np.where((keys[:, 1] < keys[:, 0])[:, None], dv01s[:, ::-1], dv01s)
+        return candidates[self.valid_spreads(dv01s)]
+    
+    def _package_row(self, structure, positions, cols):
+        """Build the structured output row for a validated butterfly or spread"""
+        tenor, tenor_key, rate, dv01, notional, pay_type = cols
+        
+        # Sort by tenor for consistent ordering
+        ordered = sorted(positions, key=tenor_key.__getitem__)
+        tenors = [tenor[p] for p in ordered]
+        rates = [rate[p] for p in ordered]
+        dv01s = [dv01[p] for p in ordered]
+        pay_types = [str(pay_type[p]) for p in ordered]
+        
+        first = positions[0]
+        pay_type_out = 'UFRO' if any(p.strip().upper() == 'UFRO' for p in pay_types) else ', '.join(pay_types)
+        return {
+            'Trade Time': self._trade_time[first],
+            'Structure': structure,
+            'Start Date': self._bucket[first],
+            'Currency': self._currency[first],
+            'Tenors': ', '.join(tenors),
+            'Rates': tuple(rates),
+            'Notionals': tuple(notional[p] for p in ordered),
+            'DV01s': tuple(dv01s),
+            'Package Price': self._package_price[first],
+            'Other Pay Types': pay_type_out,
+            'Metric (bps)': self.compute_metric(structure, rates),
+            'Expiration': self._expiration[first]
+        }
+    
     def detect_structures(self):
         """Detect trade structures (butterflies, spreads, outrights, unwinds)"""
-        today = pd.to_datetime(datetime.today().date())
+        today = np.datetime64(datetime.today().date(), 'D').astype(np.int64)
+        self._output_df = None
+        
+        # Unwind (started before today) or Outright, decided for every trade up front
+        single_structure = np.where(
+            ~self._effective_nat & (self._effective_day < today), 'Unwind', 'Outright'
+        ).tolist()
         
-        for key, group in self.df.groupby('Group Key'):
-            used_ids = set()
-            records = group.to_dict('records')
+        # Plain Python lists index faster than numpy scalars in the matching loops
+        cols = (
+            self._tenor.tolist(), self._tenor_key.tolist(), self._rate.tolist(),
+            self._dv01.tolist(), self._notional.tolist(), self._pay_type.tolist()
+        )
+        tenor, tenor_key, rate, dv01, notional, pay_type = cols
+        
+        # Group positions by trade time/effective date/currency, in sorted key order
+        for key, positions in self.df.groupby(GROUP_COLUMNS, dropna=False, observed=True).indices.items():
+            positions = positions.tolist()
+            used = set()
             
-            # Detect Butterflies (3 trades)
-            for triplet in combinations(records, 3):
-                ids = [t['Trade ID'] for t in triplet]
-                if any(i in used_ids for i in ids):
+            # Detect Butterflies (3 trades with distinct tenors)
+            for candidate in self._valid_candidates(positions, 3).tolist():
+                if any(p in used for p in candidate):
                     continue
-                
-                # Sort by tenor for consistent ordering
-                triple_data = sorted(zip(
-                    [t['T'] for t in triplet],
-                    [float(t['Rate']) for t in triplet],
-                    [float(t['DV01(USD)']) for t in triplet],
-                    [t['Notional'] for t in triplet],
-                    [str(t.get('Other Pay Type', '')) for t in triplet]
-                ), key=lambda x: self.tenor_key(x[0]))
-                
-                tenors, rates, dv01s, notionals, pay_types = zip(*triple_data)
-                
-                if self.valid_butterfly(dv01s, tenors):
-                    pay_type_out = 'UFRO' if any(p.strip().upper() == 'UFRO' for p in pay_types) else ', '.join(pay_types)
-                    
-                    self.structured_output.append({
-                        'Trade Time': triplet[0]['Trade Time'],
-                        'Structure': 'Butterfly',
-                        'Start Date': triplet[0]['Effective Bucket'],
-                        'Currency': triplet[0]['Currency'],
-                        'Tenors': ', '.join(tenors),
-                        'Rates': ', '.join(map(str, rates)),
-                        'Notionals': ', '.join(map(str, notionals)),
-                        'DV01s': ', '.join(map(str, dv01s)),
-                        'Package Price': triplet[0].get('Package Price', ''),
-                        'Other Pay Types': pay_type_out,
-                        'Metric (bps)': self.compute_metric('Butterfly', rates),
-                        'Expiration': triplet[0].get('Expiration Date', '')
-                    })
-                    used_ids.update(ids)
+                self.structured_output.append(self._package_row('Butterfly', candidate, cols))
+                used.update(candidate)
             
             # Detect Spreads (2 trades from unused)
-            unused = [t for t in records if t['Trade ID'] not in used_ids]
-            for pair in combinations(unused, 2):
-                ids = [t['Trade ID'] for t in pair]
-                if any(i in used_ids for i in ids):
+            unused = [p for p in positions if p not in used]
+            for candidate in self._valid_candidates(unused, 2).tolist():
+                if any(p in used for p in candidate):
                     continue
-                
-                # Sort by tenor for consistent ordering
-                pair_data = sorted(zip(
-                    [t['T'] for t in pair],
-                    [float(t['Rate']) for t in pair],
-                    [float(t['DV01(USD)']) for t in pair],
-                    [t['Notional'] for t in pair],
-                    [str(t.get('Other Pay Type', '')) for t in pair]
-                ), key=lambda x: self.tenor_key(x[0]))
-                
-                tenors, rates, dv01s, notionals, pay_types = zip(*pair_data)
-                
-                if self.valid_spread(dv01s, tenors):
-                    pay_type_out = 'UFRO' if any(p.strip().upper() == 'UFRO' for p in pay_types) else ', '.join(pay_types)
-                    
-                    self.structured_output.append({
-                        'Trade Time': pair[0]['Trade Time'],
-                        'Structure': 'Spread',
-                        'Start Date': pair[0]['Effective Bucket'],
-                        'Currency': pair[0]['Currency'],
-                        'Tenors': ', '.join(tenors),
-                        'Rates': ', '.join(map(str, rates)),
-                        'Notionals': ', '.join(map(str, notionals)),
-                        'DV01s': ', '.join(map(str, dv01s)),
-                        'Package Price': pair[0].get('Package Price', ''),
-                        'Other Pay Types': pay_type_out,
-                        'Metric (bps)': self.compute_metric('Spread', rates),
-                        'Expiration': pair[0].get('Expiration Date', '')
-                    })
-                    used_ids.update(ids)
+                self.structured_output.append(self._package_row('Spread', candidate, cols))
+                used.update(candidate)
             
             # Remaining trades (Outrights or Unwinds)
-            for rec in records:
-                if rec['Trade ID'] in used_ids:
+            for p in positions:
+                if p in used:
                     continue
                 
-                # Determine if Unwind or Outright
-                structure = 'Unwind' if rec['Effective Date'] < today else 'Outright'
-                
                 self.structured_output.append({
-                    'Trade Time': rec['Trade Time'],
-                    'Structure': structure,
-                    'Start Date': rec['Effective Bucket'],
-                    'Currency': rec['Currency'],
-                    'Tenors': rec['T'],
-                    'Rates': rec['Rate'],
-                    'Notionals': rec['Notional'],
-                    'DV01s': rec['DV01(USD)'],
-                    'Package Price': rec.get('Package Price', ''),
-                    'Other Pay Types': 'UFRO' if str(rec.get('Other Pay Type', '')).strip().upper() == 'UFRO' else rec.get('Other Pay Type', ''),
+                    'Trade Time': self._trade_time[p],
+                    'Structure': single_structure[p],
+                    'Start Date': self._bucket[p],
+                    'Currency': self._currency[p],
+                    'Tenors': tenor[p],
+                    'Rates': rate[p],
+                    'Notionals': notional[p],
+                    'DV01s': dv01[p],
+                    'Package Price': self._package_price[p],
+                    'Other Pay Types': 'UFRO' if str(pay_type[p]).strip().upper() == 'UFRO' else pay_type[p],
                     'Metric (bps)': '',
-                    'Expiration': rec.get('Expiration Date', '')
+                    'Expiration': self._expiration[p]
                 })
         
         logger.info(f"Detected {len(self.structured_output)} structured trades")
     
+    def format_legs(self, value):
+        """Per-leg tuple as the comma-separated text used in CSV/database output"""
+        return ', '.join(map(str, value)) if isinstance(value, tuple) else value
+    
     def save_structured_output(self):
         """Save structured output to CSV (equivalent to IRSTradeParser output)"""
         if not self.structured_output:
@@ -302,31 +451,100 @@ class DTCCAnalysis:
             return False
         
         df_output = pd.DataFrame(self.structured_output)
-        df_output.to_csv(self.output_file, index=False)
+        df_output[LEG_COLUMNS] = df_output[LEG_COLUMNS].map(self.format_legs)
+        if self.output_format == 'parquet':
+            return self._save_parquet(df_output)
+        
+        df_output.to_csv(self.output_file, index=False, chunksize=OUTPUT_CSV_CHUNKSIZE)
         logger.info(f"Saved structured output to {self.output_file}")
         return True
     
+    def _save_parquet(self, df_output):
+        """Save structured output as Parquet, keeping the metric numeric for downstream readers"""
+        # Parquet needs one type per column: legs as text, blank metrics as NaN
+        df_output[LEG_COLUMNS] = df_output[LEG_COLUMNS].astype(str)
+        df_output['Metric (bps)'] = pd.to_numeric(df_output['Metric (bps)'], errors='coerce')
+        output_file = os.path.splitext(self.output_file)[0] + '.parquet'
+        try:
+            df_output.to_parquet(output_file, index=False, compression='snappy')
+        except ImportError:
+            logger.error("Parquet output requires pyarrow (pip install pyarrow)")
+            return False
+        logger.info(f"Saved structured output to {output_file}")
+        return True
+    
     def format_dv01(self, dv01_value):
         """Format DV01 value in thousands"""
         rounded = int(round(dv01_value / 1000.0))
         return f"{rounded}k" if rounded > 0 else None
     
+    def _package_groups(self, packages, order_tenors, dv01_pick):
+        """Aggregate spreads/butterflies per (tenor label, start date) in first-seen order.
+        
+        Each package's tenors, DV01 (first or max leg) and metric are parsed once here
+        and summed/ranged in a single groupby-agg. Metrics on UFRO packages are left
+        out of the rate ranges.
+        """
+        dv01_legs = pd.DataFrame(packages['DV01s'].tolist(), index=packages.index)
+        ufro = packages['Other Pay Types'].astype(str).str.strip().str.upper() == 'UFRO'
+        frame = pd.DataFrame({
+            'Label': packages['Tenors'].map(
+                lambda tenors: ' vs '.join(order_tenors(t.strip() for t in tenors.split(',')))
+            ),
+            'Start Date': packages['Start Date'],
+            'DV01': dv01_legs[0] if dv01_pick == 'first' else dv01_legs.max(axis=1),
+            'Metric': pd.to_numeric(packages['Metric (bps)'], errors='coerce').mask(ufro),
+        })
+        return frame.groupby(['Label', 'Start Date'], sort=False).agg(
+            dv01_total=('DV01', 'sum'), min_bps=('Metric', 'min'), max_bps=('Metric', 'max')
+        ).reset_index()
+    
+    def _append_package_lines(self, output, groups):
+        """Append one line per (label, start date) group under a ^^label^^ header per label"""
+        # A stable sort on the label alone keeps start dates in first-seen order within each label
+        current_label = None
+        for label, eff, dv01_total, min_bps, max_bps in groups.sort_values('Label', kind='stable').itertuples(index=False):
+            if label != current_label:
+                output.append(f"\n^^{label}^^")
+                current_label = label
+            
+            formatted_dv01 = self.format_dv01(dv01_total)
+            if not formatted_dv01:
+                # Show small DV01s as "<1k" instead of skipping
+                formatted_dv01 = "<1k"
+            
+            if pd.notna(min_bps):
+                if min_bps != max_bps:
+                    bps_part = f" (Rate range: {min_bps:.1f}–{max_bps:.1f} bps)"
+                else:
+                    bps_part = f" (Rate: {min_bps:.1f} bps)"
+                output.append(f"{eff} - {label} traded {formatted_dv01} DV01{bps_part}")
+            else:
+                output.append(f"{eff} - {label} traded {formatted_dv01} DV01")
+    
+    def _build_output_df(self):
+        """DataFrame of structured_output with normalized columns, built once and reused per currency"""
+        if self._output_df is None:
+            df = pd.DataFrame(self.structured_output)
+            df['Structure'] = df['Structure'].fillna('')
+            df['Start Date'] = df['Start Date'].astype(str)
+            df['Expiration'] = pd.to_datetime(df['Expiration'], errors='coerce')
+            self._output_df = df
+        return self._output_df
+    
     def generate_commentary(self, currency='USD'):
         """Generate market commentary (equivalent to IRSTradeAnalysis output)"""
         if not self.structured_output:
             return f"^^{currency.upper()} SDR deals today^^\n\nNo structured data available for commentary"
         
-        df = pd.DataFrame(self.structured_output)
-        df = df[df['Currency'] == currency.upper()]
-        
+        df = self._build_output_df()
+        return self.commentary_for(df[df['Currency'] == currency.upper()], currency)
+    
+    def commentary_for(self, df, currency):
+        """Build the commentary text from one currency's rows of _build_output_df()"""
         if df.empty:
             return f"^^{currency.upper()} SDR deals today^^\n\nNo {currency.upper()} trades found"
         
-        # Normalize columns
-        df['Structure'] = df['Structure'].fillna('')
-        df['Start Date'] = df['Start Date'].astype(str)
-        df['Expiration'] = pd.to_datetime(df['Expiration'], errors='coerce')
-        
         output = [f"^^{currency.upper()} SDR deals today^^"]
         
         # --- Outright Commentary ---
@@ -334,112 +552,80 @@ class DTCCAnalysis:
         if not outright_df.empty:
             outright_df['SortKey'] = outright_df['Expiration'].fillna(pd.Timestamp.max)
             outright_df.sort_values(by='SortKey', inplace=True)
-            outright_groups = defaultdict(list)
             
-            for _, row in outright_df.iterrows():
-                key = f"{row['Start Date']} - {row['Tenors']}"
-                outright_groups[key].append(row)
+            # One groupby-agg per (start date - tenor) label, in the expiration order above
+            ufro = outright_df['Other Pay Types'].astype(str).str.strip().str.upper() == 'UFRO'
+            outright_groups = pd.DataFrame({
+                'Label': outright_df['Start Date'] + ' - ' + outright_df['Tenors'].astype(str),
+                'DV01': pd.to_numeric(outright_df['DV01s']),
+                'Rate': pd.to_numeric(outright_df['Rates']).mask(ufro),
+            }).groupby('Label', sort=False).agg(
+                dv01_total=('DV01', 'sum'), min_rate=('Rate', 'min'), max_rate=('Rate', 'max')
+            )
             
-            if outright_groups:
-                output.append(f"\n^^{currency.upper()} Outrights^^")
-                for label in outright_groups:
-                    trades = outright_groups[label]
-                    dv01_total = sum(float(t['DV01s']) for t in trades if pd.notna(t['DV01s']))
-                    formatted_dv01 = self.format_dv01(dv01_total)
-                    if not formatted_dv01:
-                        continue
-                    
-                    rates = [float(t['Rates']) for t in trades if str(t['Other Pay Types']).strip().upper() != 'UFRO']
-                    if rates:
-                        min_rate, max_rate = min(rates), max(rates)
-                        if min_rate != max_rate:
-                            rate_range = f" (Rate range: {min_rate:.4f}–{max_rate:.4f})"
-                        else:
-                            rate_range = f" (Rate: {min_rate:.4f})"
-                        output.append(f"{label} traded {formatted_dv01} DV01{rate_range}")
+            output.append(f"\n^^{currency.upper()} Outrights^^")
+            for label, dv01_total, min_rate, max_rate in outright_groups.itertuples():
+                formatted_dv01 = self.format_dv01(dv01_total)
+                if not formatted_dv01:
+                    continue
+                
+                if pd.notna(min_rate):
+                    if min_rate != max_rate:
+                        rate_range = f" (Rate range: {min_rate:.4f}–{max_rate:.4f})"
                     else:
-                        output.append(f"{label} traded {formatted_dv01} DV01")
+                        rate_range = f" (Rate: {min_rate:.4f})"
+                    output.append(f"{label} traded {formatted_dv01} DV01{rate_range}")
+                else:
+                    output.append(f"{label} traded {formatted_dv01} DV01")
         
         # --- Spread Commentary ---
         spread_df = df[df['Structure'] == 'Spread']
         if not spread_df.empty:
-            spread_groups = defaultdict(list)
-            for _, row in spread_df.iterrows():
-                tenors = sorted(t.strip() for t in row['Tenors'].split(','))
-                pair = f"{tenors[0]} vs {tenors[1]}"
-                key = (pair, row['Start Date'])
-                spread_groups[key].append(row)
+            spread_groups = self._package_groups(spread_df, sorted, 'first')
             
-            if spread_groups:
+            if not spread_groups.empty:
                 output.append(f"\n^^{currency.upper()} Spreads^^")
-                pairs_ordered = sorted(set(k[0] for k in spread_groups.keys()))
-                for pair in pairs_ordered:
-                    output.append(f"\n^^{pair}^^")
-                    # Process all groups for this pair
-                    pair_groups = [(p, eff, rows) for (p, eff), rows in spread_groups.items() if p == pair]
-                    for (p, eff, rows) in pair_groups:
-                        total_dv01 = sum(float(r['DV01s'].split(',')[0]) for r in rows)
-                        formatted_dv01 = self.format_dv01(total_dv01)
-                        if not formatted_dv01:
-                            # Show small DV01s as "<1k" instead of skipping
-                            formatted_dv01 = "<1k"
-                        
-                        bps_vals = [float(r['Metric (bps)']) for r in rows 
-                                   if pd.notna(r['Metric (bps)']) and r['Metric (bps)'] != '' 
-                                   and str(r['Other Pay Types']).strip().upper() != 'UFRO']
-                        if bps_vals:
-                            min_bps, max_bps = min(bps_vals), max(bps_vals)
-                            if min_bps != max_bps:
-                                bps_part = f" (Rate range: {min_bps:.1f}–{max_bps:.1f} bps)"
-                            else:
-                                bps_part = f" (Rate: {min_bps:.1f} bps)"
-                            output.append(f"{eff} - {pair} traded {formatted_dv01} DV01{bps_part}")
-                        else:
-                            output.append(f"{eff} - {pair} traded {formatted_dv01} DV01")
+                self._append_package_lines(output, spread_groups)
         
         # --- Butterfly Commentary ---
         butterfly_df = df[df['Structure'] == 'Butterfly']
         if not butterfly_df.empty:
-            butterfly_groups = defaultdict(list)
-            for _, row in butterfly_df.iterrows():
-                tenors = sorted((t.strip() for t in row['Tenors'].split(',')), 
-                               key=lambda x: self.tenor_key(x))
-                label = f"{tenors[0]} vs {tenors[1]} vs {tenors[2]}"
-                key = (label, row['Start Date'])
-                butterfly_groups[key].append(row)
+            butterfly_groups = self._package_groups(
+                butterfly_df, lambda tenors: sorted(tenors, key=self.tenor_key), 'max'
+            )
             
-            if butterfly_groups:
+            if not butterfly_groups.empty:
                 output.append(f"\n^^{currency.upper()} Butterflies^^")
-                flies_ordered = sorted(set(k[0] for k in butterfly_groups.keys()))
-                for label in flies_ordered:
-                    output.append(f"\n^^{label}^^")
-                    # Process all groups for this label
-                    label_groups = [(triplet, eff, rows) for (triplet, eff), rows in butterfly_groups.items() if triplet == label]
-                    for (triplet, eff, rows) in label_groups:
-                        max_dv01s = [max(float(x) for x in r['DV01s'].split(',')) for r in rows]
-                        total_dv01 = sum(max_dv01s)
-                        formatted_dv01 = self.format_dv01(total_dv01)
-                        if not formatted_dv01:
-                            # Show small DV01s as "<1k" instead of skipping
-                            formatted_dv01 = "<1k"
-                        
-                        bps_vals = [float(r['Metric (bps)']) for r in rows 
-                                   if pd.notna(r['Metric (bps)']) and r['Metric (bps)'] != '' 
-                                   and str(r['Other Pay Types']).strip().upper() != 'UFRO']
-                        if bps_vals:
-                            min_bps, max_bps = min(bps_vals), max(bps_vals)
-                            if min_bps != max_bps:
-                                bps_part = f" (Rate range: {min_bps:.1f}–{max_bps:.1f} bps)"
-                            else:
-                                bps_part = f" (Rate: {min_bps:.1f} bps)"
-                            output.append(f"{eff} - {triplet} traded {formatted_dv01} DV01{bps_part}")
-                        else:
-                            output.append(f"{eff} - {triplet} traded {formatted_dv01} DV01")
+                self._append_package_lines(output, butterfly_groups)
         
         return '\n'.join(output)
     
-    def run_analysis(self, currencies=['USD', 'EUR', 'GBP', 'JPY', 'INR', 'SGD', 'AUD', 'THB', 'TWD', 'KRW', 'HKD']):
-        """Run complete analysis pipeline"""
+    def generate_all_commentary(self, currencies, parallel=True):
+        """Generate commentary for several currencies.
+        
+        Large outputs use one worker process per currency; parallel=False always
+        stays in this process (e.g. inside a multi-threaded web worker).
+        """
+        if not self.structured_output:
+            return {currency: self.generate_commentary(currency) for currency in currencies}
+        
+        df = self._build_output_df()
+        by_currency = {currency: df[df['Currency'] == currency.upper()] for currency in currencies}
+        
+        workers = min(len(currencies), os.cpu_count() or 1)
+        if not parallel or workers <= 1 or len(df) < PARALLEL_COMMENTARY_MIN_ROWS:
+            return {currency: self.commentary_for(by_currency[currency], currency) for currency in currencies}
+        
+        # Each currency's commentary is independent; workers only receive their own rows
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                currency: executor.submit(_currency_commentary, by_currency[currency], currency)
+                for currency in currencies
+            }
+            return {currency: future.result() for currency, future in futures.items()}
+    
+    def run_analysis(self, currencies=['USD', 'EUR', 'GBP', 'JPY', 'INR', 'SGD', 'AUD', 'THB', 'TWD', 'KRW', 'HKD'], parallel=True):
+        """Run complete analysis pipeline; parallel=False keeps commentary generation in-process"""
         logger.info("Starting DTCC trade analysis...")
         
         # Load and prepare data
@@ -453,14 +639,13 @@ class DTCCAnalysis:
         if not self.save_structured_output():
             return False
         
-        # Generate commentary for each currency
-        commentary_results = {}
+        # Generate commentary for each currency, in parallel only for large outputs
+        commentary_results = self.generate_all_commentary(currencies, parallel)
         for currency in currencies:
-            commentary = self.generate_commentary(currency)
-            commentary_results[currency] = commentary
+            commentary = commentary_results[currency]
             
-            # Save individual currency commentary
-            filename = f'{currency.lower()}_commentary.txt'
+            # Save individual currency commentary, next to the structured output
+            filename = os.path.join(os.path.dirname(self.output_file), f'{currency.lower()}_commentary.txt')
             try:
                 with open(filename, 'w', encoding='utf-8') as f:
                     f.write(commentary)
@@ -474,7 +659,7 @@ class DTCCAnalysis:
         )
         
         try:
-            with open('market_commentary.txt', 'w', encoding='utf-8') as f:
+            with open(os.path.join(os.path.dirname(self.output_file), 'market_commentary.txt'), 'w', encoding='utf-8') as f:
                 f.write(combined_commentary)
             logger.info("Generated market_commentary.txt")
         except Exception as e:
@@ -483,12 +668,23 @@ class DTCCAnalysis:
         logger.info("Analysis completed successfully")
         return True
 
-def main():
-    """Main execution function"""
-    analyzer = DTCCAnalysis()
+def _currency_commentary(df, currency):
+    """Process pool entry point for DTCCAnalysis.generate_all_commentary"""
+    return DTCCAnalysis().commentary_for(df, currency)
+
+def main(base_dir=None, parallel=True):
+    """Main execution function; reads and writes files in base_dir (default: current directory).
+    
+    Pass parallel=False when calling from a multi-threaded process such as a web
+    worker, where forking a process pool is unsafe.
+    """
+    if base_dir is None:
+        analyzer = DTCCAnalysis()
+    else:
+        analyzer = DTCCAnalysis(os.path.join(base_dir, 'trade_data.csv'), os.path.join(base_dir, 'structured_output.csv'))
     
     # Run analysis for all supported currencies including Asian markets
-    success = analyzer.run_analysis(['USD', 'EUR', 'GBP', 'JPY', 'INR', 'SGD', 'AUD', 'THB', 'TWD', 'KRW', 'HKD'])
+    success = analyzer.run_analysis(['USD', 'EUR', 'GBP', 'JPY', 'INR', 'SGD', 'AUD', 'THB', 'TWD', 'KRW', 'HKD'], parallel)
     
     if success:
         print("DTCC Analysis completed successfully!")
@@ -498,6 +694,7 @@ def main():
         print("- Individual currency commentary files")
     else:
         print("Analysis failed. Check logs for details.")
+    return success
 
 if __name__ == "__main__":
     main()
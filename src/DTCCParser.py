@@ -1,27 +1,234 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import csv
-from datetime import datetime
+import hashlib
+import json
+import math
+import mmap
 import os
+import time
+from operator import itemgetter
+
+# orjson parses the (large) DTCC payload several times faster; optional, stdlib json otherwise
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
 
 DTCC_API_URL = "https://pddata.dtcc.com/ppd/api/ticker/CFTC/RATES"
 CSV_FILE_NAME = "trade_data.csv"
+# One trade time per line for every row in CSV_FILE_NAME, so duplicate checks don't re-parse the CSV
+TIMESTAMPS_FILE_NAME = CSV_FILE_NAME + ".timestamps"
+# Opt-in for very large archives: check duplicates against a fixed-size Bloom filter file
+# instead of a set of every trade time. About BLOOM_ERROR_RATE of genuinely new trades are
+# taken for duplicates and skipped, so leave this off unless the set no longer fits in memory.
+USE_BLOOM_FILTER = os.environ.get("TRADE_DEDUP_BLOOM") == "1"
+BLOOM_FILE_NAME = CSV_FILE_NAME + ".bloom"
+BLOOM_CAPACITY = 10_000_000
+BLOOM_ERROR_RATE = 0.001
+# Archive format for fetched trades: 'csv' (CSV_FILE_NAME) or 'parquet' (a dataset
+# under PARQUET_DATASET_DIR, partitioned by currency)
+ARCHIVE_FORMAT = os.environ.get("TRADE_ARCHIVE_FORMAT", "csv")
+PARQUET_DATASET_DIR = "trades"
+# ETag/Last-Modified of the last payload stored, sent back so unchanged polls get a bodyless 304
+ETAG_FILE_NAME = ".dtcc_etag"
+
+# (connect, read) timeouts for DTCC requests, in seconds
+REQUEST_TIMEOUT = (3.05, 10)
+
+# Reused across polls so the TCP/TLS connection to DTCC is kept alive; transient
+# 429/5xx responses are retried with exponential backoff
+_session = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=4, pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 502, 503, 504])
+)
+_session.mount('https://', _adapter)
+_session.mount('http://', _adapter)
+
+CSV_FIELDNAMES = (
+    'Trade Time', 'Effective Date', 'Expiration Date', 'Tenor', 'Currency',
+    'Rates', 'Notionals', 'Dv01', 'Frequency', 'Action Type', 'Event Type',
+    'Asset Class', 'UPI Underlier Name', 'Unique Product Identifier',
+    'Dissemination Identifier', 'Original Dissemination Identifier', 'Other Payment Type', 'Package Indicator',
+    'Floating Rate Payment Frequency Period Leg2', 'Floating Rate Payment Frequency Period Multiplier Leg2',
+    'Fixed Rate Payment Frequency Period Leg1', 'Fixed Rate Payment Frequency Period Multiplier Leg1'
+)
+
+# Rows from process_trades carry every column; pulls them out as tuples in header order
+_row_values = itemgetter(*CSV_FIELDNAMES)
+
+# CSV column -> DTCC JSON field, for the fields copied from the API as-is
+TRADE_FIELDS = {
+    'Trade Time': 'eventTimestamp',
+    'Effective Date': 'effectiveDate',
+    'Expiration Date': 'expirationDate',
+    'Currency': 'notionalCurrencyLeg1',
+    'Notionals': 'notionalAmountLeg1',
+    'Frequency': 'Settlement currency-Leg 1',
+    'Action Type': 'actionType',
+    'Event Type': 'eventType',
+    'Asset Class': 'assetClass',
+    'UPI Underlier Name': 'uniqueProductIdentifierUnderlierName',
+    'Unique Product Identifier': 'uniqueProductIdentifier',
+    'Dissemination Identifier': 'disseminationIdentifier',
+    'Original Dissemination Identifier': 'originalDisseminationIdentifier',
+    'Other Payment Type': 'otherPaymentType',
+    'Package Indicator': 'packageIndicator',
+    'Floating Rate Payment Frequency Period Leg2': 'floatingRatePaymentFrequencyPeriodLeg2',
+    'Floating Rate Payment Frequency Period Multiplier Leg2': 'floatingRatePaymentFrequencyPeriodMultiplierLeg2',
+    'Fixed Rate Payment Frequency Period Leg1': 'fixedRatePaymentFrequencyPeriodLeg1',
+    'Fixed Rate Payment Frequency Period Multiplier Leg1': 'fixedRatePaymentFrequencyPeriodMultiplierLeg1',
+}
+
+# Every JSON field process_trades reads, fetched from a trade in one itemgetter call
+_TRADE_KEYS = tuple(TRADE_FIELDS.values()) + ('fixedRateLeg1', 'spreadLeg1')
+_trade_values = itemgetter(*_TRADE_KEYS)
+
+def _trade_row(trade):
+    """All _TRADE_KEYS values of a trade, '' for fields the trade doesn't have"""
+    try:
+        return _trade_values(trade)
+    except KeyError:
+        return tuple(trade.get(key, '') for key in _TRADE_KEYS)
+
+def _load_validators():
+    """Cache validators saved by the previous fetch, as conditional request headers"""
+    try:
+        with open(ETAG_FILE_NAME, 'r') as f:
+            saved = json.load(f)
+    except (IOError, ValueError):
+        return {}
+    
+    headers = {}
+    if saved.get('etag'):
+        headers['If-None-Match'] = saved['etag']
+    if saved.get('last_modified'):
+        headers['If-Modified-Since'] = saved['last_modified']
+    return headers
+
+def save_validators(validators):
+    """Remember validators returned by fetch_trade_data for the next fetch's conditional request.
+    
+    Call only once the fetched trades have been stored: a later fetch may then get a 304
+    and never see those trades again.
+    """
+    if not validators:
+        return
+    try:
+        with open(ETAG_FILE_NAME, 'w') as f:
+            json.dump(validators, f)
+    except IOError as e:
+        print(f"Error writing {ETAG_FILE_NAME}: {e}")
 
 def fetch_trade_data():
+    """(json_data, validators) of the current DTCC payload.
+    
+    json_data is None if the fetch failed, and has an empty 'tradeList' if nothing changed
+    since the validators last passed to save_validators; validators is None in both cases.
+    """
     try:
-        response = requests.get(DTCC_API_URL)
+        response = _session.get(DTCC_API_URL, headers=_load_validators(), timeout=REQUEST_TIMEOUT)
+        if response.status_code == 304:
+            # Nothing changed since the last fetch: an empty trade list means no new trades
+            print("Trade data not modified since last fetch")
+            return {'tradeList': []}, None
         response.raise_for_status()  # Raise an exception for HTTP errors
-        return response.json()
-    except requests.exceptions.RequestException as e:
+        json_data = json_loads(response.content)
+    except (requests.exceptions.RequestException, ValueError) as e:
         print(f"Error fetching data: {e}")
-        return None
+        return None, None
+    
+    validators = {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+    }
+    return json_data, validators
+
+class TradeTimeBloom:
+    """Bloom filter of trade times kept in a memory-mapped file (~1.8 MB per million trades at 0.1%)"""
+    
+    def __init__(self, path, capacity=BLOOM_CAPACITY, error_rate=BLOOM_ERROR_RATE):
+        self.path = path
+        self.num_bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        size = (self.num_bits + 7) // 8
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # A new file, or one sized for other settings, starts out empty
+            self.is_new = os.fstat(fd).st_size != size
+            if self.is_new:
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size)
+            self._bits = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+    
+    def _positions(self, value):
+        # Double hashing: k bit positions from the two halves of one 128-bit digest
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+    
+    def __contains__(self, value):
+        bits = self._bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(value))
+    
+    def update(self, values):
+        bits = self._bits
+        for value in values:
+            for pos in self._positions(value):
+                bits[pos >> 3] |= 1 << (pos & 7)
+        self._bits.flush()
+        # Stamp the file so it reads as newer than the CSV it was just brought up to date with
+        os.utime(self.path)
+
+# BLOOM_FILE_NAME, mapped once for the life of the process
+_bloom = None
+
+def _bloom_filter():
+    global _bloom
+    if _bloom is None:
+        _bloom = TradeTimeBloom(BLOOM_FILE_NAME)
+    return _bloom
 
 def get_existing_trade_timestamps():
-    """Read existing trade timestamps from CSV to check for duplicates"""
+    """Read existing trade timestamps to check for duplicates"""
+    if ARCHIVE_FORMAT == 'parquet':
+        return get_existing_parquet_timestamps()
+    if USE_BLOOM_FILTER:
+        return get_existing_trade_bloom()
+    return _read_csv_trade_timestamps()
+
+def get_existing_trade_bloom():
+    """Bloom filter of existing trade times, rebuilt from the CSV when missing or stale"""
+    bloom = _bloom_filter()
+    try:
+        stale = bloom.is_new or os.path.getmtime(BLOOM_FILE_NAME) < os.path.getmtime(CSV_FILE_NAME)
+    except OSError:
+        stale = False  # no CSV yet
+    if stale:
+        bloom.update(_read_csv_trade_timestamps())
+        bloom.is_new = False
+    return bloom
+
+def _read_csv_trade_timestamps():
     existing_timestamps = set()
     
     if not os.path.exists(CSV_FILE_NAME):
         return existing_timestamps
     
+    # The sidecar is appended right after the CSV, so it is only stale if the CSV changed since
+    try:
+        if os.path.getmtime(TIMESTAMPS_FILE_NAME) >= os.path.getmtime(CSV_FILE_NAME):
+            with open(TIMESTAMPS_FILE_NAME, 'r') as f:
+                existing_timestamps.update(line for line in f.read().split('\n') if line)
+            return existing_timestamps
+    except OSError:
+        pass
+    
     try:
         with open(CSV_FILE_NAME, 'r', newline='') as csvfile:
             reader = csv.DictReader(csvfile)
@@ -32,83 +239,63 @@ def get_existing_trade_timestamps():
                     existing_timestamps.add(trade_time)
     except IOError as e:
         print(f"Error reading existing CSV file: {e}")
+        return existing_timestamps
+    
+    # Rebuild the sidecar from the CSV for the next run
+    try:
+        with open(TIMESTAMPS_FILE_NAME, 'w') as f:
+            f.writelines(f"{trade_time}\n" for trade_time in existing_timestamps)
+    except IOError as e:
+        print(f"Error writing {TIMESTAMPS_FILE_NAME}: {e}")
     
     return existing_timestamps
 
-def calculate_dv01(notional, rates, tenor_in_years):
+def get_existing_parquet_timestamps():
+    """Read existing trade timestamps from the Parquet archive (only the Trade Time column)"""
+    if not os.path.isdir(PARQUET_DATASET_DIR):
+        return set()
+    
+    import pyarrow.parquet as pq
+    try:
+        trade_times = pq.read_table(PARQUET_DATASET_DIR, columns=['Trade Time']).column(0).to_pylist()
+    except (IOError, ValueError) as e:
+        print(f"Error reading existing Parquet archive: {e}")
+        return set()
+    return {trade_time for trade_time in trade_times if trade_time}
+
+def calculate_dv01_batch(notional, rates, tenor_in_years):
+    """Dv01 of each trade from float64 arrays in one pass; NaN wherever an input is missing"""
     # This is a placeholder for Dv01 calculation.
     # A more accurate calculation would require a proper interest rate model.
     # For simplicity, we'll use a basic approximation: Dv01 = Notional * Rates * Tenor / 10000
-    try:
-        notional = float(str(notional).replace(',', ''))
-        rates = float(rates)
-        dv01 = (notional * rates * tenor_in_years) / 10000
-        return round(dv01, 2)
-    except (ValueError, TypeError):
-        return None
+    return ((notional * rates * tenor_in_years) / 10000).round(2)
 
 def process_trades(trade_list):
-    processed_data = []
-    for trade in trade_list:
-        trade_time = trade.get('eventTimestamp', '')
-        effective_date = trade.get('effectiveDate', '')
-        expiration_date = trade.get('expirationDate', '')
-        currency = trade.get('notionalCurrencyLeg1', '')
-        rates = trade.get('fixedRateLeg1', '') or trade.get('spreadLeg1', '')
-        notionals = trade.get('notionalAmountLeg1', '')
-        action_type = trade.get('actionType', '')
-        event_type = trade.get('eventType', '')
-        asset_class = trade.get('assetClass', '')
-        upi_underlier_name = trade.get('uniqueProductIdentifierUnderlierName', '')
-        frequency= trade.get('Settlement currency-Leg 1','')
-        unique_product_identifier = trade.get('uniqueProductIdentifier', '')
-        
-        # New fields to be added
-        floating_rate_payment_frequency_period_leg2 = trade.get('floatingRatePaymentFrequencyPeriodLeg2', '')
-        floating_rate_payment_frequency_period_multiplier_leg2 = trade.get('floatingRatePaymentFrequencyPeriodMultiplierLeg2', '')
-        dissemination_identifier = trade.get('disseminationIdentifier', '')
-        original_dissemination_identifier = trade.get('originalDisseminationIdentifier', '')
-        other_payment_type = trade.get('otherPaymentType', '')
-        fixed_rate_payment_frequency_period_leg1 = trade.get('fixedRatePaymentFrequencyPeriodLeg1', '')
-        fixed_rate_payment_frequency_period_multiplier_leg1 = trade.get('fixedRatePaymentFrequencyPeriodMultiplierLeg1', '')
-        package_indicator = trade.get('packageIndicator', '')
-        # Determine Tenor in years for Dv01 calculation
-        tenor_in_years = None
-        if effective_date and expiration_date:
-            try:
-                effective_dt = datetime.strptime(effective_date, '%Y-%m-%d')
-                expiration_dt = datetime.strptime(expiration_date, '%Y-%m-%d')
-                tenor_in_years = (expiration_dt - effective_dt).days / 365.25
-            except ValueError:
-                pass
-
-        dv01 = calculate_dv01(notionals, rates, tenor_in_years) if tenor_in_years is not None else None
-
-        processed_data.append({
-            'Trade Time': trade_time,
-            'Effective Date': effective_date,
-            'Expiration Date': expiration_date,
-            'Tenor': tenor_in_years,
-            'Currency': currency,
-            'Rates': rates,
-            'Notionals': notionals,
-            'Dv01': dv01,
-            'Frequency':frequency,
-            'Action Type': action_type,
-            'Event Type': event_type,
-            'Asset Class': asset_class,
-            'UPI Underlier Name': upi_underlier_name,
-            'Unique Product Identifier': unique_product_identifier,
-            'Dissemination Identifier': dissemination_identifier,
-            'Original Dissemination Identifier': original_dissemination_identifier,
-            'Other Payment Type': other_payment_type,
-            'Package Indicator': package_indicator,
-            'Floating Rate Payment Frequency Period Leg2': floating_rate_payment_frequency_period_leg2,
-            'Floating Rate Payment Frequency Period Multiplier Leg2': floating_rate_payment_frequency_period_multiplier_leg2,
-            'Fixed Rate Payment Frequency Period Leg1': fixed_rate_payment_frequency_period_leg1,
-            'Fixed Rate Payment Frequency Period Multiplier Leg1': fixed_rate_payment_frequency_period_multiplier_leg1
-        })
-    return processed_data
+    # pandas is only needed here, keep it off the import path of the web app
+    import pandas as pd
+    
+    # One pass over the trades, then split into per-field columns
+    values = list(zip(*map(_trade_row, trade_list))) or [()] * len(_TRADE_KEYS)
+    columns = dict(zip(TRADE_FIELDS, values))
+    rates = [fixed or spread for fixed, spread in zip(values[-2], values[-1])]
+    
+    # Determine Tenor in years for Dv01 calculation, for all trades at once
+    effective_dt = pd.to_datetime(pd.Series(columns['Effective Date'], dtype=object), format='%Y-%m-%d', errors='coerce', cache=True)
+    expiration_dt = pd.to_datetime(pd.Series(columns['Expiration Date'], dtype=object), format='%Y-%m-%d', errors='coerce', cache=True)
+    tenor_in_years = (expiration_dt - effective_dt).dt.days / 365.25
+    
+    notionals = pd.Series(columns['Notionals'], dtype=object).astype(str).str.replace(',', '', regex=False)
+    dv01 = calculate_dv01_batch(
+        pd.to_numeric(notionals, errors='coerce').to_numpy(dtype=float),
+        pd.to_numeric(pd.Series(rates, dtype=object), errors='coerce').to_numpy(dtype=float),
+        tenor_in_years.to_numpy(dtype=float)
+    )
+    
+    columns['Tenor'] = [None if tenor != tenor else tenor for tenor in tenor_in_years.tolist()]
+    columns['Rates'] = rates
+    columns['Dv01'] = [None if value != value else value for value in dv01.tolist()]
+    
+    return [dict(zip(CSV_FIELDNAMES, row)) for row in zip(*(columns[column] for column in CSV_FIELDNAMES))]
 
 def filter_new_trades(processed_data, existing_timestamps):
     """Filter out trades that already exist in the CSV file"""
@@ -121,31 +308,66 @@ def filter_new_trades(processed_data, existing_timestamps):
     return new_trades
 
 def append_to_csv(data):
-    fieldnames = [
-        'Trade Time', 'Effective Date', 'Expiration Date', 'Tenor', 'Currency',
-        'Rates', 'Notionals', 'Dv01', 'Frequency', 'Action Type', 'Event Type',
-        'Asset Class', 'UPI Underlier Name', 'Unique Product Identifier',
-        'Dissemination Identifier', 'Original Dissemination Identifier', 'Other Payment Type', 'Package Indicator',
-        'Floating Rate Payment Frequency Period Leg2', 'Floating Rate Payment Frequency Period Multiplier Leg2',
-        'Fixed Rate Payment Frequency Period Leg1', 'Fixed Rate Payment Frequency Period Multiplier Leg1'
-    ]
+    """Append trades to CSV_FILE_NAME; False if the CSV could not be written"""
     try:
-        with open(CSV_FILE_NAME, 'a', newline='') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        # 1 MiB buffer: the rows go out in a few large writes, flushed when the block closes
+        with open(CSV_FILE_NAME, 'a', newline='', buffering=1 << 20) as csvfile:
+            writer = csv.writer(csvfile)
             # Write header only if the file is empty
             if csvfile.tell() == 0:
-                writer.writeheader()
-            writer.writerows(data)
+                writer.writerow(CSV_FIELDNAMES)
+            writer.writerows(map(_row_values, data))
         print(f"Appended {len(data)} new trades to {CSV_FILE_NAME}")
     except IOError as e:
         print(f"Error writing to CSV file: {e}")
+        return False
+    
+    # Keep the timestamps sidecar in step with the CSV
+    try:
+        with open(TIMESTAMPS_FILE_NAME, 'a') as f:
+            f.writelines(f"{trade['Trade Time']}\n" for trade in data if trade.get('Trade Time'))
+    except IOError as e:
+        print(f"Error writing {TIMESTAMPS_FILE_NAME}: {e}")
+    
+    if USE_BLOOM_FILTER:
+        _bloom_filter().update(trade['Trade Time'] for trade in data if trade.get('Trade Time'))
+    return True
+
+def append_to_parquet(data):
+    """Append trades to the Parquet archive as one new file per currency partition; False on failure"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    # Fixed column types so every appended file shares one schema
+    schema = pa.schema([
+        (name, pa.float64() if name in ('Tenor', 'Dv01') else pa.string()) for name in CSV_FIELDNAMES
+    ])
+    columns = {
+        name: [row[name] for row in data] if name in ('Tenor', 'Dv01')
+        else [None if row[name] is None else str(row[name]) for row in data]
+        for name in CSV_FIELDNAMES
+    }
+    try:
+        # Time-ordered file names keep the archive readable back in append order
+        pq.write_to_dataset(
+            pa.Table.from_pydict(columns, schema=schema), root_path=PARQUET_DATASET_DIR,
+            partition_cols=['Currency'], basename_template=f"part-{time.time_ns()}-{{i}}.parquet"
+        )
+        print(f"Appended {len(data)} new trades to {PARQUET_DATASET_DIR}/")
+    except (IOError, ValueError) as e:
+        print(f"Error writing to Parquet archive: {e}")
+        return False
+    return True
 
 if __name__ == "__main__":
     # Get existing trade timestamps to check for duplicates
     existing_timestamps = get_existing_trade_timestamps()
-    print(f"Found {len(existing_timestamps)} existing trades in CSV")
+    if USE_BLOOM_FILTER:
+        print(f"Checking duplicates against Bloom filter {BLOOM_FILE_NAME}")
+    else:
+        print(f"Found {len(existing_timestamps)} existing trades in CSV")
     
-    json_data = fetch_trade_data()
+    json_data, validators = fetch_trade_data()
     if json_data and 'tradeList' in json_data:
         trades = json_data['tradeList']
         processed_trades = process_trades(trades)
@@ -155,13 +377,21 @@ if __name__ == "__main__":
             new_trades = filter_new_trades(processed_trades, existing_timestamps)
             
             if new_trades:
-                append_to_csv(new_trades)
+                if ARCHIVE_FORMAT == 'parquet':
+                    appended = append_to_parquet(new_trades)
+                else:
+                    appended = append_to_csv(new_trades)
+                if appended:
+                    # The trades are stored; the next fetch may skip this payload
+                    save_validators(validators)
                 print(f"Total trades fetched: {len(processed_trades)}")
-                print(f"New trades added: {len(new_trades)}")
+                print(f"New trades added: {len(new_trades) if appended else 0}")
                 print(f"Duplicate trades skipped: {len(processed_trades) - len(new_trades)}")
             else:
+                save_validators(validators)
                 print("No new trades found. All trades already exist in CSV.")
         else:
+            save_validators(validators)
             print("No trade data to process.")
     else:
         print("No trade data fetched or 'tradeList' not found in response.")
\ No newline at end of file
@@ -3,15 +3,50 @@
 Database backup utility for production persistence
 """
 import os
+import gzip
 import shutil
 import sqlite3
+import tempfile
+from contextlib import closing
 from pathlib import Path
 from datetime import datetime
 import logging
 
 logger = logging.getLogger(__name__)
 
-def backup_database(db_path, backup_dir=None):
+def _copy_sqlite(source_path, target_path):
+    """Copy one SQLite database onto another with the online backup API.
+    
+    Unlike copying the file, this goes through SQLite, so it is safe while the
+    source is in use and picks up pages still sitting in its WAL file.
+    """
+    with closing(sqlite3.connect(source_path)) as source, closing(sqlite3.connect(target_path)) as target:
+        source.backup(target)
+
+def _compress_backup(path):
+    """Compress a finished backup file (zstd if installed, gzip otherwise), replacing it"""
+    try:
+        import zstandard
+        compressed = path.with_name(path.name + '.zst')
+        with open(path, 'rb') as source, open(compressed, 'wb') as target:
+            zstandard.ZstdCompressor(level=7).copy_stream(source, target)
+    except ImportError:
+        compressed = path.with_name(path.name + '.gz')
+        with open(path, 'rb') as source, gzip.open(compressed, 'wb') as target:
+            shutil.copyfileobj(source, target, 1 << 20)
+    path.unlink()
+    return compressed
+
+def _open_backup(path):
+    """Open a backup for reading, decompressing .zst/.gz backups on the fly"""
+    if path.suffix == '.zst':
+        import zstandard
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+    if path.suffix == '.gz':
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+def backup_database(db_path, backup_dir=None, compress=True):
     """Create a backup of the database before any operations"""
     try:
         if not Path(db_path).exists():
@@ -28,8 +63,10 @@ def backup_database(db_path, backup_dir=None):
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         backup_path = backup_dir / f"app_backup_{timestamp}.db"
         
-        # Copy database file
-        shutil.copy2(db_path, backup_path)
+        # Copy database pages (consistent snapshot, even with the app writing)
+        _copy_sqlite(db_path, backup_path)
+        if compress:
+            backup_path = _compress_backup(backup_path)
         
         logger.info(f"Database backed up to: {backup_path}")
         return backup_path
@@ -49,8 +86,18 @@ def restore_database(backup_path, db_path):
         if Path(db_path).exists():
             backup_database(db_path)
         
-        # Restore from backup
-        shutil.copy2(backup_path, db_path)
+        # Restore from backup (compressed backups are unpacked to a temporary file first)
+        backup_path = Path(backup_path)
+        if backup_path.suffix in ('.zst', '.gz'):
+            with tempfile.NamedTemporaryFile(dir=backup_path.parent, suffix='.db', delete=False) as unpacked:
+                with _open_backup(backup_path) as source:
+                    shutil.copyfileobj(source, unpacked, 1 << 20)
+            try:
+                _copy_sqlite(unpacked.name, db_path)
+            finally:
+                os.unlink(unpacked.name)
+        else:
+            _copy_sqlite(backup_path, db_path)
         
         logger.info(f"Database restored from: {backup_path}")
         return True
@@ -59,30 +106,52 @@ def restore_database(backup_path, db_path):
         logger.error(f"Failed to restore database: {e}")
         return False
 
+# database path -> ((mtime_ns, size, wal mtime_ns), (is_valid, message)) of its last check
+_integrity_cache = {}
+
 def check_database_integrity(db_path):
-    """Check if database is valid and not corrupted"""
+    """Check if database is valid and not corrupted.
+    
+    The result is cached until the file (or its WAL) changes, since
+    PRAGMA quick_check still reads every page.
+    """
     try:
         if not Path(db_path).exists():
             return False, "Database file does not exist"
-            
-        # Try to open and query the database
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        # Check if tables exist
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = cursor.fetchall()
         
-        if not tables:
-            return False, "No tables found in database"
+        stat = os.stat(db_path)
+        wal_path = Path(f"{db_path}-wal")
+        # In WAL mode recent writes land in the -wal file until a checkpoint
+        wal_mtime = wal_path.stat().st_mtime_ns if wal_path.exists() else None
+        stat_key = (stat.st_mtime_ns, stat.st_size, wal_mtime)
+        cached = _integrity_cache.get(str(db_path))
+        if cached and cached[0] == stat_key:
+            return cached[1]
             
-        # Check if we can query trade_records table
-        cursor.execute("SELECT COUNT(*) FROM trade_records LIMIT 1;")
-        count = cursor.fetchone()[0]
-        
-        conn.close()
+        # Open read-only so the probe never takes a write lock
+        with closing(sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)) as conn:
+            cursor = conn.cursor()
+            
+            # Check if tables exist
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+            tables = cursor.fetchall()
+            
+            if not tables:
+                return False, "No tables found in database"
+                
+            # Check we can read trade_records without counting the whole table
+            cursor.execute("SELECT 1 FROM trade_records LIMIT 1;")
+            has_trades = cursor.fetchone() is not None
+            
+            cursor.execute("PRAGMA quick_check;")
+            quick_check = cursor.fetchone()[0]
         
-        return True, f"Database is valid with {count} trade records"
+        if quick_check != "ok":
+            result = (False, f"Database quick_check failed: {quick_check}")
+        else:
+            result = (True, "Database is valid" + ("" if has_trades else " (no trade records)"))
+        _integrity_cache[str(db_path)] = (stat_key, result)
+        return result
         
     except Exception as e:
         return False, f"Database integrity check failed: {e}"
@@ -15,6 +15,34 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
+
+# orjson encodes API responses several times faster; optional, Flask's stdlib json otherwise
+try:
+    import orjson
+    from flask.json.provider import DefaultJSONProvider
+
+    class OrjsonProvider(DefaultJSONProvider):
+        """Flask's JSON provider with orjson doing the encoding"""
+        # Dates go through DefaultJSONProvider.default (HTTP date strings) as before
+        OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+        def dumps(self, obj, **kwargs):
+            if kwargs.get('indent'):
+                # Pretty-printed debug responses keep the stdlib encoder
+                return super().dumps(obj, **kwargs)
+            return orjson.dumps(obj, default=self.default, option=self.OPTIONS).decode()
+
+        def response(self, *args, **kwargs):
+            if (self.compact is None and self._app.debug) or self.compact is False:
+                return super().response(*args, **kwargs)
+            # Hand orjson's bytes straight to the response instead of decoding to str and re-encoding
+            obj = self._prepare_response_obj(args, kwargs)
+            body = orjson.dumps(obj, default=self.default, option=self.OPTIONS | orjson.OPT_APPEND_NEWLINE)
+            return self._app.response_class(body, mimetype=self.mimetype)
+
+    app.json = OrjsonProvider(app)
+except ImportError:
+    pass
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dtcc-analysis-secret-key-2025')
 
 # --- DB configuration (single source of truth) ---
@@ -63,6 +91,8 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
     "pool_pre_ping": True,
     "pool_size": 5,
     "max_overflow": 0,
+    # Compiled-statement cache (default 500); the API's filter combinations stay well inside it
+    "query_cache_size": 1200,
 }
 CORS(app)
 db.init_app(app)
@@ -85,38 +115,140 @@ from sqlalchemy import event
 from sqlalchemy.engine import Engine
 
 with app.app_context():
-    @event.listens_for(Engine, "connect")
-    def _sqlite_pragmas(dbapi_connection, connection_record):
-        try:
-            cursor = dbapi_connection.cursor()
-            cursor.execute("PRAGMA journal_mode=WAL;")
-            cursor.execute("PRAGMA synchronous=NORMAL;")
-            cursor.execute("PRAGMA busy_timeout=10000;")  # 10s wait on locks
-            cursor.close()
-        except Exception:
-            pass
+    if app.config["SQLALCHEMY_DATABASE_URI"].startswith("sqlite"):
+        @event.listens_for(Engine, "connect")
+        def _sqlite_pragmas(dbapi_connection, connection_record):
+            try:
+                cursor = dbapi_connection.cursor()
+                cursor.execute("PRAGMA journal_mode=WAL;")
+                cursor.execute("PRAGMA synchronous=NORMAL;")
+                cursor.execute("PRAGMA busy_timeout=10000;")  # 10s wait on locks
+                cursor.execute("PRAGMA cache_size=-262144;")  # 256 MiB page cache
+                cursor.execute("PRAGMA mmap_size=1073741824;")  # 1 GiB memory-mapped reads
+                cursor.execute("PRAGMA temp_store=MEMORY;")
+                cursor.close()
+            except Exception:
+                pass
 
     # Log the effective DB once app context is available
     uri = app.config["SQLALCHEMY_DATABASE_URI"]
     logger.info(f"[BOOT] DB URI: {uri}")
 
-# Import routes/services AFTER db.init_app(app)
-from src.routes.api_fixed import api_bp, init_data_processor
-app.register_blueprint(api_bp, url_prefix="/api")
+def _register_routes(app):
+    """Import and register the API blueprint; called once, after db.init_app(app)"""
+    from src.routes.api_fixed import api_bp
+    app.register_blueprint(api_bp, url_prefix="/api")
 
-# Create database tables
-with app.app_context():
-    db.create_all()
-    logger.info("Database tables created successfully")
+def _add_missing_columns():
+    """Add nullable model columns that tables created by older versions lack"""
+    from sqlalchemy import inspect, text
+    inspector = inspect(db.engine)
+    added = []
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            with db.engine.begin() as conn:
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+            logger.info(f"Added column {table.name}.{column.name}")
+            added.append(f"{table.name}.{column.name}")
+    
+    if 'structured_trades.first_dv01' in added:
+        # Backfill from the stored DV01 strings
+        from src.models.trade_data import StructuredTrade, first_dv01
+        rows = db.session.query(StructuredTrade.id, StructuredTrade.dv01s).all()
+        db.session.bulk_update_mappings(StructuredTrade, [
+            {'id': row_id, 'first_dv01': first_dv01(dv01s)} for row_id, dv01s in rows
+        ])
+        db.session.commit()
 
-# Start background worker(s) inside app context
-with app.app_context():
-    scheduler = init_data_processor(app)
-    if scheduler:
-        logger.info("🔄 AUTOMATIC SCHEDULER STARTED - Scripts will run every 60 seconds")
-        logger.info("📊 DTCCParser.py + DTCCAnalysis.py will execute automatically")
+def _dedupe_dissemination_ids():
+    """Drop duplicate trade_records.dissemination_identifier rows so its unique index can be built.
+
+    Databases from before the index may hold the same trade more than once; the first
+    stored row is kept. Empty identifiers become NULL, which the index allows repeatedly.
+    """
+    from sqlalchemy import inspect, text
+    inspector = inspect(db.engine)
+    if not inspector.has_table('trade_records'):
+        return
+    if any(index['unique'] and index['column_names'] == ['dissemination_identifier']
+           for index in inspector.get_indexes('trade_records')):
+        return
+    # The DELETE below removes rows; keep a copy of the database as it was
+    url = db.engine.url
+    if url.get_backend_name() == 'sqlite' and url.database:
+        from src.database_backup import backup_database
+        if not backup_database(url.database):
+            raise RuntimeError("Could not back up the database before removing duplicate trade records")
     else:
-        logger.error("❌ Failed to start automatic scheduler")
+        logger.warning("No backup taken before removing duplicate trade records (not SQLite)")
+    
+    with db.engine.begin() as conn:
+        conn.execute(text(
+            "UPDATE trade_records SET dissemination_identifier = NULL WHERE dissemination_identifier = ''"
+        ))
+        removed = conn.execute(text(
+            'DELETE FROM trade_records WHERE dissemination_identifier IS NOT NULL AND id NOT IN ('
+            'SELECT MIN(id) FROM trade_records WHERE dissemination_identifier IS NOT NULL '
+            'GROUP BY dissemination_identifier)'
+        )).rowcount
+        # A plain index of the same name would make the unique one look like it exists
+        for index in inspector.get_indexes('trade_records'):
+            if index['column_names'] == ['dissemination_identifier']:
+                conn.execute(text(f'DROP INDEX {index["name"]}'))
+    logger.info(f"Removed {removed} duplicate trade records before adding the dissemination_identifier unique index")
+
+def _create_tables(app):
+    """Create missing tables, columns and indexes"""
+    with app.app_context():
+        _add_missing_columns()
+        db.create_all()
+        _dedupe_dissemination_ids()
+        # create_all() skips existing tables, so add any model indexes (e.g. the
+        # trade_time index behind ORDER BY trade_time DESC exports) that older
+        # databases were created without
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                try:
+                    index.create(bind=db.engine, checkfirst=True)
+                except Exception as e:
+                    if index.unique:
+                        # Ingest's INSERT ... ON CONFLICT needs it; don't start without it
+                        raise RuntimeError(f"Could not create unique index {index.name}: {e}") from e
+                    logger.warning(f"Could not create index {index.name}: {e}")
+        # Pooled SQLite connections opened before the DDL above keep their old schema, and
+        # SQLite resolves ON CONFLICT targets against it when preparing; start with fresh ones
+        db.engine.dispose()
+        logger.info("Database tables created successfully")
+
+_register_routes(app)
+
+# Set AUTO_CREATE_TABLES=0 once the schema exists to skip the per-table
+# reflection round trips on every cold start
+app.config["AUTO_CREATE_TABLES"] = os.environ.get("AUTO_CREATE_TABLES", "1") != "0"
+if app.config["AUTO_CREATE_TABLES"]:
+    _create_tables(app)
+else:
+    logger.info("Table creation skipped (AUTO_CREATE_TABLES=0)")
+
+# Start background worker(s) inside app context. Set ENABLE_PROCESSOR=0 on
+# web-only processes so they skip the processor's startup cost.
+if os.environ.get("ENABLE_PROCESSOR", "1") != "0":
+    from src.routes.api_fixed import init_data_processor
+    with app.app_context():
+        scheduler = init_data_processor(app)
+        if scheduler:
+            logger.info("🔄 AUTOMATIC SCHEDULER STARTED - Scripts will run every 60 seconds")
+            logger.info("📊 DTCCParser.py + DTCCAnalysis.py will execute automatically")
+        else:
+            logger.error("❌ Failed to start automatic scheduler")
+else:
+    logger.info("Background processor disabled (ENABLE_PROCESSOR=0)")
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
@@ -4,9 +4,54 @@ import json
 
 db = SQLAlchemy()
 
+def bulk_insert(model, records, batch_size=10_000, commit=True):
+    """Insert plain dict rows for a model in batches, committing once at the end.
+    
+    With commit=False the rows stay in the caller's open transaction.
+    """
+    for start in range(0, len(records), batch_size):
+        db.session.bulk_insert_mappings(model, records[start:start + batch_size])
+    if commit:
+        db.session.commit()
+    return len(records)
+
+def bulk_insert_ignore_duplicates(model, records, index_elements, batch_size=10_000):
+    """Insert plain dict rows, letting the database skip rows that collide on a unique index.
+    
+    Uses INSERT ... ON CONFLICT DO NOTHING on SQLite/PostgreSQL so duplicates are found
+    through the index instead of a Python set of every existing key. Returns the number
+    of rows actually inserted.
+    """
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return bulk_insert(model, records, batch_size)
+    
+    stmt = insert(model.__table__).on_conflict_do_nothing(index_elements=index_elements)
+    inserted = 0
+    for start in range(0, len(records), batch_size):
+        batch = records[start:start + batch_size]
+        result = db.session.execute(stmt, batch)
+        inserted += result.rowcount if result.rowcount >= 0 else len(batch)
+    db.session.commit()
+    return inserted
+
+def first_dv01(dv01s):
+    """First leg of a comma-separated DV01 string as a float, None if it doesn't parse"""
+    try:
+        return float(dv01s.split(',')[0]) if dv01s else 0.0
+    except (ValueError, AttributeError):
+        return None
+
 class TradeRecord(db.Model):
     """Model for storing individual trade records"""
     __tablename__ = 'trade_records'
+    __table_args__ = (
+        db.Index('ix_trade_records_currency_trade_time', 'currency', 'trade_time'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     trade_time = db.Column(db.DateTime, nullable=False, index=True)
@@ -23,7 +68,7 @@ class TradeRecord(db.Model):
     asset_class = db.Column(db.String(50), nullable=True)
     upi_underlier_name = db.Column(db.String(200), nullable=True)
     unique_product_identifier = db.Column(db.String(100), nullable=True)
-    dissemination_identifier = db.Column(db.String(100), nullable=True)
+    dissemination_identifier = db.Column(db.String(100), nullable=True, unique=True, index=True)  # Dedup key for ingest
     other_payment_type = db.Column(db.String(100), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
@@ -52,6 +97,9 @@ class TradeRecord(db.Model):
 class StructuredTrade(db.Model):
     """Model for storing structured trade analysis results"""
     __tablename__ = 'structured_trades'
+    __table_args__ = (
+        db.Index('ix_structured_trades_analysis_date_currency', 'analysis_date', 'currency'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     trade_time = db.Column(db.DateTime, nullable=False, index=True)
@@ -62,6 +110,7 @@ class StructuredTrade(db.Model):
     rates = db.Column(db.Text, nullable=False)  # Comma-separated rates
     notionals = db.Column(db.Text, nullable=False)  # Comma-separated notionals
     dv01s = db.Column(db.Text, nullable=False)  # Comma-separated DV01s
+    first_dv01 = db.Column(db.Float, nullable=True)  # first_dv01(dv01s), so DV01 totals are a SQL SUM
     package_price = db.Column(db.String(100), nullable=True)
     other_pay_types = db.Column(db.Text, nullable=True)
     metric_bps = db.Column(db.Float, nullable=True)  # Spread/butterfly metric in bps
@@ -91,6 +140,10 @@ class StructuredTrade(db.Model):
 class Commentary(db.Model):
     """Model for storing generated market commentary"""
     __tablename__ = 'commentaries'
+    __table_args__ = (
+        # Per-day/currency delete-and-replace and the currency + date range commentary lookups
+        db.Index('ix_commentaries_analysis_date_currency', 'analysis_date', 'currency'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     currency = db.Column(db.String(10), nullable=False, index=True)
@@ -1,34 +1,49 @@
 # src/paths.py
 import os
+from functools import cache
 from pathlib import Path
 
 # Determine the repository root
 REPO_ROOT = Path(__file__).resolve().parents[1]  # points to /opt/render/project
 
-# Data directories - force /var/data in production, current dir locally
-if os.environ.get("RENDER"):
-    # Production - MUST use /var/data for persistence
-    DATA_DIR = Path("/var/data")
-else:
-    # Local development - use current directory
-    DATA_DIR = Path(os.environ.get("DATA_DIR", Path.cwd()))
+@cache
+def data_dir() -> Path:
+    """Data directory, resolved and created on first use - /var/data in production, current dir locally"""
+    if os.environ.get("RENDER"):
+        # Production - MUST use /var/data for persistence
+        path = Path("/var/data")
+    else:
+        # Local development - use current directory
+        path = Path(os.environ.get("DATA_DIR", Path.cwd()))
 
-TMP_DIR = Path("/tmp")
+    # Ensure the directory exists (only if we have permission)
+    try:
+        path.mkdir(parents=True, exist_ok=True)
+    except PermissionError:
+        # Fallback to current directory if we can't create the target
+        path = Path.cwd()
+        path.mkdir(parents=True, exist_ok=True)
+    return path
 
-# Ensure directories exist (only if we have permission)
-try:
-    DATA_DIR.mkdir(parents=True, exist_ok=True)
-except PermissionError:
-    # Fallback to current directory if we can't create the target
-    DATA_DIR = Path.cwd()
-    DATA_DIR.mkdir(parents=True, exist_ok=True)
+@cache
+def tmp_dir() -> Path:
+    """Scratch directory, created on first use"""
+    path = Path("/tmp")
+    try:
+        path.mkdir(parents=True, exist_ok=True)
+    except PermissionError:
+        # Fallback to temp directory
+        import tempfile
+        path = Path(tempfile.gettempdir())
+    return path
 
-try:
-    TMP_DIR.mkdir(parents=True, exist_ok=True)
-except PermissionError:
-    # Fallback to temp directory
-    import tempfile
-    TMP_DIR = Path(tempfile.gettempdir())
+def __getattr__(name):
+    # DATA_DIR / TMP_DIR used to be module constants; keep them importable, resolved lazily
+    if name == 'DATA_DIR':
+        return data_dir()
+    if name == 'TMP_DIR':
+        return tmp_dir()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Export paths for use in other modules
-__all__ = ['REPO_ROOT', 'DATA_DIR', 'TMP_DIR']
\ No newline at end of file
+__all__ = ['REPO_ROOT', 'data_dir', 'tmp_dir']
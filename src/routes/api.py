@@ -1,11 +1,34 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
 from datetime import datetime, date, timedelta
 from src.models.trade_data import db, Commentary, StructuredTrade, ProcessingLog
 from src.services.data_processor_real import DataProcessor
+from sqlalchemy import select
 import json
+import time
+from itertools import groupby
 
 api_bp = Blueprint('api', __name__)
 
+# StructuredTrade.to_dict() fields, selected as plain columns for the list endpoint
+STRUCTURED_TRADE_FIELDS = (
+    'id', 'trade_time', 'structure', 'start_date', 'currency', 'tenors', 'rates', 'notionals',
+    'dv01s', 'package_price', 'other_pay_types', 'metric_bps', 'expiration', 'analysis_date', 'created_at'
+)
+ISOFORMAT_FIELDS = ('trade_time', 'expiration', 'analysis_date', 'created_at')
+
+# Commentary.to_dict() fields, selected as plain columns
+COMMENTARY_FIELDS = (
+    'id', 'currency', 'commentary_text', 'analysis_date', 'trade_count', 'total_dv01', 'structures_summary', 'created_at'
+)
+
+def _commentary_row_dict(row):
+    """Commentary.to_dict() for a plain row of COMMENTARY_FIELDS"""
+    commentary = dict(zip(COMMENTARY_FIELDS, row))
+    commentary['analysis_date'] = row.analysis_date.isoformat() if row.analysis_date else None
+    commentary['structures_summary'] = json.loads(row.structures_summary) if row.structures_summary else {}
+    commentary['created_at'] = row.created_at.isoformat() if row.created_at else None
+    return commentary
+
 # Global data processor instance
 data_processor = None
 
@@ -41,20 +64,20 @@ def get_commentary():
         except ValueError:
             return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
         
-        # Get commentary data
-        commentaries = Commentary.query.filter(
-            Commentary.currency.in_(currencies),
-            Commentary.analysis_date >= start_dt,
-            Commentary.analysis_date <= end_dt
-        ).order_by(Commentary.analysis_date.desc(), Commentary.currency).all()
-        
-        # Group by date
-        result = {}
-        for commentary in commentaries:
-            date_str = commentary.analysis_date.isoformat()
-            if date_str not in result:
-                result[date_str] = {}
-            result[date_str][commentary.currency] = commentary.to_dict()
+        # Get commentary data as plain rows (no ORM objects)
+        commentaries = db.session.execute(
+            select(*(getattr(Commentary, field) for field in COMMENTARY_FIELDS)).filter(
+                Commentary.currency.in_(currencies),
+                Commentary.analysis_date >= start_dt,
+                Commentary.analysis_date < end_dt + timedelta(days=1)
+            ).order_by(Commentary.analysis_date.desc(), Commentary.currency)
+        ).all()
+        
+        # Group by date; rows are ordered by date, so each date's rows are contiguous
+        result = {
+            analysis_date.isoformat(): {row.currency: _commentary_row_dict(row) for row in group}
+            for analysis_date, group in groupby(commentaries, key=lambda row: row.analysis_date)
+        }
         
         return jsonify({
             'success': True,
@@ -69,20 +92,32 @@ def get_commentary():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Seconds /currencies reuses its DISTINCT query in-process, and the max-age of the low-churn lookups
+LOOKUP_CACHE_TTL = 60
+_currencies_cache = (0.0, None)  # (monotonic expiry, sorted currency list)
+
 @api_bp.route('/currencies', methods=['GET'])
 def get_available_currencies():
     """Get list of available currencies"""
+    global _currencies_cache
     try:
-        currencies = db.session.query(Commentary.currency).distinct().all()
-        currency_list = [c[0] for c in currencies]
-        
-        if not currency_list:
-            currency_list = ['USD', 'EUR', 'GBP', 'JPY']  # Default currencies
+        expires, currency_list = _currencies_cache
+        if currency_list is None or time.monotonic() >= expires:
+            currencies = db.session.query(Commentary.currency).distinct().all()
+            currency_list = [c[0] for c in currencies]
+            
+            if not currency_list:
+                currency_list = ['USD', 'EUR', 'GBP', 'JPY']  # Default currencies
+            currency_list = sorted(currency_list)
+            _currencies_cache = (time.monotonic() + LOOKUP_CACHE_TTL, currency_list)
         
-        return jsonify({
+        response = jsonify({
             'success': True,
-            'currencies': sorted(currency_list)
+            'currencies': currency_list
         })
+        response.cache_control.public = True
+        response.cache_control.max_age = LOOKUP_CACHE_TTL
+        return response
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -99,11 +134,15 @@ def get_available_date_range():
         if not max_date:
             max_date = date.today()
         
-        return jsonify({
+        response = jsonify({
             'success': True,
             'min_date': min_date.isoformat(),
             'max_date': max_date.isoformat()
         })
+        # A new analysis date can appear any time today, so only a short max-age
+        response.cache_control.public = True
+        response.cache_control.max_age = LOOKUP_CACHE_TTL
+        return response
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -118,25 +157,20 @@ def get_processing_status():
         
         status = data_processor.get_processing_status()
         
-        # Add summary statistics
+        # Add summary statistics, all four counts in one round trip
         today = date.today()
-        today_trades = StructuredTrade.query.filter(
-            StructuredTrade.analysis_date == today
-        ).count()
-        
-        today_commentaries = Commentary.query.filter(
-            Commentary.analysis_date == today
-        ).count()
-        
-        total_trades = StructuredTrade.query.count()
-        total_commentaries = Commentary.query.count()
-        
-        status.update({
-            'today_trades': today_trades,
-            'today_commentaries': today_commentaries,
-            'total_trades': total_trades,
-            'total_commentaries': total_commentaries
-        })
+        
+        def count(model, *criteria):
+            return select(db.func.count()).select_from(model).where(*criteria).scalar_subquery()
+        
+        counts = db.session.execute(select(
+            count(StructuredTrade, StructuredTrade.analysis_date == today).label('today_trades'),
+            count(Commentary, Commentary.analysis_date == today).label('today_commentaries'),
+            count(StructuredTrade).label('total_trades'),
+            count(Commentary).label('total_commentaries')
+        )).one()
+        
+        status.update(counts._asdict())
         
         return jsonify({
             'success': True,
@@ -200,8 +234,8 @@ def get_structured_trades():
         end_date = request.args.get('end_date')
         structure = request.args.get('structure')  # Optional structure filter
         
-        # Build query
-        query = StructuredTrade.query
+        # Build query over plain columns; rows come back as tuples, not ORM objects
+        query = select(*(getattr(StructuredTrade, field) for field in STRUCTURED_TRADE_FIELDS))
         
         if currencies:
             query = query.filter(StructuredTrade.currency.in_(currencies))
@@ -212,18 +246,44 @@ def get_structured_trades():
         
         if end_date:
             end_dt = datetime.strptime(end_date, '%Y-%m-%d').date()
-            query = query.filter(StructuredTrade.analysis_date <= end_dt)
+            query = query.filter(StructuredTrade.analysis_date < end_dt + timedelta(days=1))
         
         if structure:
             query = query.filter(StructuredTrade.structure == structure)
         
-        trades = query.order_by(StructuredTrade.trade_time.desc()).limit(1000).all()
-        
-        return jsonify({
-            'success': True,
-            'data': [trade.to_dict() for trade in trades],
-            'count': len(trades)
-        })
+        query = query.order_by(StructuredTrade.trade_time.desc()).limit(1000)
+        
+        # Run the query and fetch its first batch before responding, so a failing
+        # query still gets the 500 below instead of a truncated 200
+        batches = db.session.execute(query.execution_options(yield_per=200)).partitions()
+        first_batch = next(batches, [])
+        
+        def generate():
+            # Same body as jsonify({'success', 'data', 'count'}), written one row at a time
+            yield '{"success": true, "data": ['
+            count = 0
+            error = None
+            batch = first_batch
+            while batch:
+                for row in batch:
+                    trade = dict(zip(STRUCTURED_TRADE_FIELDS, row))
+                    for field in ISOFORMAT_FIELDS:
+                        if trade[field]:
+                            trade[field] = trade[field].isoformat()
+                    yield (', ' if count else '') + current_app.json.dumps(trade)
+                    count += 1
+                try:
+                    batch = next(batches, [])
+                except Exception as e:
+                    # Headers are already sent; close the JSON and report the failure in it
+                    error = str(e)
+                    break
+            if error is None:
+                yield f'], "count": {count}}}'
+            else:
+                yield f'], "count": {count}, "error": {current_app.json.dumps(error)}}}'
+        
+        return Response(stream_with_context(generate()), mimetype='application/json')
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -244,47 +304,27 @@ def get_summary():
         start_dt = datetime.strptime(start_date, '%Y-%m-%d').date()
         end_dt = datetime.strptime(end_date, '%Y-%m-%d').date()
         
-        # Get structured trades in date range
-        trades = StructuredTrade.query.filter(
+        # Aggregate structured trades in date range in the database
+        in_range = (
             StructuredTrade.analysis_date >= start_dt,
-            StructuredTrade.analysis_date <= end_dt
-        ).all()
+            StructuredTrade.analysis_date < end_dt + timedelta(days=1)
+        )
+        
+        def counts_by(column):
+            return db.session.query(column, db.func.count()).filter(*in_range).group_by(column).all()
+        
+        by_currency = dict(counts_by(StructuredTrade.currency))
         
         # Calculate summary statistics
         summary = {
-            'total_trades': len(trades),
-            'by_currency': {},
-            'by_structure': {},
-            'by_date': {},
-            'total_dv01': 0
+            'total_trades': sum(by_currency.values()),
+            'by_currency': by_currency,
+            'by_structure': dict(counts_by(StructuredTrade.structure)),
+            'by_date': {analysis_date.isoformat(): count for analysis_date, count in counts_by(StructuredTrade.analysis_date)},
         }
         
-        for trade in trades:
-            # By currency
-            currency = trade.currency
-            if currency not in summary['by_currency']:
-                summary['by_currency'][currency] = 0
-            summary['by_currency'][currency] += 1
-            
-            # By structure
-            structure = trade.structure
-            if structure not in summary['by_structure']:
-                summary['by_structure'][structure] = 0
-            summary['by_structure'][structure] += 1
-            
-            # By date
-            date_str = trade.analysis_date.isoformat()
-            if date_str not in summary['by_date']:
-                summary['by_date'][date_str] = 0
-            summary['by_date'][date_str] += 1
-            
-            # Total DV01 (approximate from first DV01 value)
-            try:
-                dv01_str = trade.dv01s.split(',')[0] if trade.dv01s else '0'
-                dv01_value = float(dv01_str)
-                summary['total_dv01'] += dv01_value
-            except:
-                pass
+        # Total DV01 (approximate from first DV01 value)
+        summary['total_dv01'] = db.session.query(db.func.sum(StructuredTrade.first_dv01)).filter(*in_range).scalar() or 0.0
         
         return jsonify({
             'success': True,
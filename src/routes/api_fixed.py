@@ -1,16 +1,40 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, g, current_app
 from datetime import datetime, date, timedelta
 import os
-import sys
 import json
-import subprocess
+import hashlib
 import logging
-from src.models.trade_data import db, ProcessingLog
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from sqlalchemy.orm import load_only
+from src.models.trade_data import db, ProcessingLog, TradeRecord
+from src.services.simple_scheduler import get_scheduler
+from src.services.commentary_files import COMMENTARY_DIR, ALL_CURRENCIES, collect_commentary
 
 logger = logging.getLogger(__name__)
 
 api_bp = Blueprint('api', __name__)
 
+# Stable across workers and restarts (unlike hash()), so proxies can revalidate against any of them
+_CCYS_ETAG = hashlib.md5(','.join(ALL_CURRENCIES).encode()).hexdigest()
+
+# Most ProcessingLog rows any endpoint shows
+RECENT_LOGS_LIMIT = 10
+
+def _recent_logs(limit=RECENT_LOGS_LIMIT):
+    """Newest ProcessingLog rows, queried once per request and shared by its callers"""
+    if 'recent_logs' not in g:
+        g.recent_logs = ProcessingLog.query.options(load_only(
+            ProcessingLog.process_type, ProcessingLog.status, ProcessingLog.run_timestamp,
+            ProcessingLog.records_processed, ProcessingLog.execution_time_seconds, ProcessingLog.error_message
+        )).order_by(ProcessingLog.run_timestamp.desc()).limit(RECENT_LOGS_LIMIT).all()
+    return g.recent_logs[:limit]
+
+def _scheduler_status():
+    """Scheduler status file contents, read once per request"""
+    if 'scheduler_status' not in g:
+        g.scheduler_status = get_scheduler().get_status()
+    return g.scheduler_status
+
 @api_bp.route('/commentary', methods=['GET'])
 def get_commentary():
     """Get market commentary data by reading generated files directly"""
@@ -21,54 +45,19 @@ def get_commentary():
         end_date = request.args.get('end_date')
         
         if not currencies:
-            currencies = ['USD', 'EUR', 'GBP', 'JPY', 'INR', 'SGD', 'AUD', 'THB', 'TWD', 'KRW', 'HKD']
+            currencies = ALL_CURRENCIES
         
         # Read commentary files directly
         commentary_data = {}
         today = date.today().isoformat()
         
-        # Get the directory where commentary files are stored
-        script_dir = os.path.dirname(os.path.dirname(__file__))
-        
-        for currency in currencies:
-            try:
-                commentary_file = os.path.join(script_dir, f'{currency.lower()}_commentary.txt')
+        # Trade count and DV01 are extracted from the commentary text
+        for currency, parsed in collect_commentary(currencies).items():
+            if parsed['commentary_text']:
+                if today not in commentary_data:
+                    commentary_data[today] = {}
                 
-                if os.path.exists(commentary_file):
-                    with open(commentary_file, 'r', encoding='utf-8') as f:
-                        commentary_text = f.read().strip()
-                    
-                    if commentary_text:
-                        if today not in commentary_data:
-                            commentary_data[today] = {}
-                        
-                        # Count trades and calculate DV01 from commentary
-                        trade_count = commentary_text.count('traded')
-                        total_dv01 = 0
-                        
-                        # Extract DV01 values from commentary
-                        import re
-                        dv01_matches = re.findall(r'(\d+(?:\.\d+)?[kM]?)\s+DV01', commentary_text)
-                        for match in dv01_matches:
-                            try:
-                                if 'k' in match:
-                                    total_dv01 += float(match.replace('k', '')) * 1000
-                                elif 'M' in match:
-                                    total_dv01 += float(match.replace('M', '')) * 1000000
-                                else:
-                                    total_dv01 += float(match)
-                            except:
-                                continue
-                        
-                        commentary_data[today][currency] = {
-                            'commentary_text': commentary_text,
-                            'trade_count': trade_count,
-                            'total_dv01': total_dv01
-                        }
-                        
-            except Exception as e:
-                logger.warning(f"Error reading commentary for {currency}: {e}")
-                continue
+                commentary_data[today][currency] = parsed
         
         return jsonify({
             'success': True,
@@ -84,53 +73,20 @@ def get_summary():
     """Get summary statistics"""
     try:
         # Calculate summary from commentary files
-        script_dir = os.path.dirname(os.path.dirname(__file__))
-        currencies = ['USD', 'EUR', 'GBP', 'JPY', 'INR', 'SGD', 'AUD', 'THB', 'TWD', 'KRW', 'HKD']
-        
         total_trades = 0
         total_dv01 = 0
         active_currencies = 0
         by_currency = {}
         
-        for currency in currencies:
-            try:
-                commentary_file = os.path.join(script_dir, f'{currency.lower()}_commentary.txt')
-                
-                if os.path.exists(commentary_file):
-                    with open(commentary_file, 'r', encoding='utf-8') as f:
-                        commentary_text = f.read().strip()
-                    
-                    if commentary_text and 'traded' in commentary_text:
-                        active_currencies += 1
-                        
-                        # Count trades
-                        trade_count = commentary_text.count('traded')
-                        total_trades += trade_count
-                        
-                        # Extract DV01
-                        import re
-                        currency_dv01 = 0
-                        dv01_matches = re.findall(r'(\d+(?:\.\d+)?[kM]?)\s+DV01', commentary_text)
-                        for match in dv01_matches:
-                            try:
-                                if 'k' in match:
-                                    currency_dv01 += float(match.replace('k', '')) * 1000
-                                elif 'M' in match:
-                                    currency_dv01 += float(match.replace('M', '')) * 1000000
-                                else:
-                                    currency_dv01 += float(match)
-                            except:
-                                continue
-                        
-                        total_dv01 += currency_dv01
-                        by_currency[currency] = {
-                            'trade_count': trade_count,
-                            'total_dv01': currency_dv01
-                        }
-                        
-            except Exception as e:
-                logger.warning(f"Error processing summary for {currency}: {e}")
-                continue
+        for currency, parsed in collect_commentary(ALL_CURRENCIES, with_text=False).items():
+            if parsed['trade_count']:
+                active_currencies += 1
+                total_trades += parsed['trade_count']
+                total_dv01 += parsed['total_dv01']
+                by_currency[currency] = {
+                    'trade_count': parsed['trade_count'],
+                    'total_dv01': parsed['total_dv01']
+                }
         
         return jsonify({
             'success': True,
@@ -150,11 +106,15 @@ def get_summary():
 def get_currencies():
     """Get available currencies"""
     try:
-        currencies = ['USD', 'EUR', 'GBP', 'JPY', 'INR', 'SGD', 'AUD', 'THB', 'TWD', 'KRW', 'HKD']
-        return jsonify({
+        response = jsonify({
             'success': True,
-            'currencies': currencies
+            'currencies': list(ALL_CURRENCIES)
         })
+        # Fixed list: let clients and proxies keep it for an hour and revalidate by ETag
+        response.cache_control.public = True
+        response.cache_control.max_age = 3600
+        response.set_etag(_CCYS_ETAG)
+        return response.make_conditional(request)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -163,12 +123,17 @@ def get_currencies():
 def get_available_date_range():
     """Get available date range"""
     try:
-        today = date.today()
-        return jsonify({
+        now = datetime.now()
+        today = now.date()
+        response = jsonify({
             'success': True,
             'min_date': today.isoformat(),
             'max_date': today.isoformat()
         })
+        # Only changes at midnight
+        response.cache_control.public = True
+        response.cache_control.max_age = int((datetime.combine(today + timedelta(days=1), datetime.min.time()) - now).total_seconds())
+        return response
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -177,17 +142,13 @@ def get_available_date_range():
 def get_status():
     """Get processing status including real scheduler status"""
     try:
-        from src.services.simple_scheduler import get_scheduler
-        
         # Get scheduler status
-        scheduler = get_scheduler()
-        status_data = scheduler.get_status()
+        status_data = _scheduler_status()
         
         # Get processing logs from database
         recent_logs = []
         try:
-            db_logs = ProcessingLog.query.order_by(ProcessingLog.run_timestamp.desc()).limit(10).all()
-            for log in db_logs:
+            for log in _recent_logs():
                 recent_logs.append({
                     'process_type': log.process_type.upper(),
                     'status': log.status,
@@ -224,33 +185,36 @@ def get_status():
         logger.error(f"Error getting status: {e}")
         return jsonify({'error': str(e)}), 500
 
+# Manual analysis runs on a single background thread so a request waits at most
+# MANUAL_RUN_TIMEOUT seconds (as the old subprocess did); a second run queues behind the first
+MANUAL_RUN_TIMEOUT = 60
+_ANALYSIS_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix='manual-analysis')
+
 @api_bp.route('/manual-run', methods=['POST'])
 def manual_run():
     """Manually trigger data analysis only"""
     try:
-        # Run DTCCAnalysis.py directly
-        script_dir = os.path.dirname(os.path.dirname(__file__))
-        script_path = os.path.join(script_dir, 'DTCCAnalysis.py')
+        # Run DTCCAnalysis in-process (no interpreter start-up or pandas re-import per run);
+        # imported here so the web process only loads pandas once analysis is requested
+        from src.DTCCAnalysis import main as run_analysis
         
-        if os.path.exists(script_path):
-            result = subprocess.run([
-                sys.executable, script_path
-            ], cwd=script_dir, capture_output=True, text=True, timeout=60)
-            
-            if result.returncode == 0:
-                return jsonify({
-                    'success': True,
-                    'message': 'Manual analysis completed successfully'
-                })
-            else:
-                return jsonify({
-                    'success': False,
-                    'error': result.stderr
-                })
+        # Serial commentary: forking a process pool from this multi-threaded worker can deadlock
+        analysis = _ANALYSIS_POOL.submit(run_analysis, COMMENTARY_DIR, False)
+        try:
+            success = analysis.result(timeout=MANUAL_RUN_TIMEOUT)
+        except FutureTimeoutError:
+            logger.error(f"Manual analysis still running after {MANUAL_RUN_TIMEOUT}s")
+            return jsonify({'error': f'Analysis timed out after {MANUAL_RUN_TIMEOUT} seconds'}), 500
+        
+        if success:
+            return jsonify({
+                'success': True,
+                'message': 'Manual analysis completed successfully'
+            })
         else:
             return jsonify({
                 'success': False,
-                'error': 'DTCCAnalysis.py not found'
+                'error': 'Analysis failed. Check logs for details.'
             })
         
     except Exception as e:
@@ -260,8 +224,6 @@ def manual_run():
 def manual_refresh():
     """Force refresh - run both parser and analysis"""
     try:
-        from src.services.simple_scheduler import get_scheduler
-        
         # Use scheduler for manual execution
         scheduler = get_scheduler()
         success = scheduler.run_manual()
@@ -314,7 +276,6 @@ def mcp_query():
 def db_debug():
     """Debug endpoint to verify database connection and data"""
     try:
-        from flask import current_app
         uri = current_app.config.get("SQLALCHEMY_DATABASE_URI", "")
         
         # Get counts using the shared db instance
@@ -335,11 +296,8 @@ def db_debug():
 def get_background_processing_status():
     """Get current background processing status"""
     try:
-        from flask import current_app
-        from datetime import datetime
-        
         # Get recent processing logs
-        recent_logs = ProcessingLog.query.order_by(ProcessingLog.run_timestamp.desc()).limit(3).all()
+        recent_logs = _recent_logs(3)
         
         status_messages = []
         
@@ -4,6 +4,8 @@ import os
 import json
 import subprocess
 import logging
+from src.services.commentary_files import ALL_CURRENCIES, COMMENTARY_PATHS, collect_commentary, cached_json_response, commentary_stats
+from src.services.background_jobs import submit_job, job_status
 
 logger = logging.getLogger(__name__)
 
@@ -26,59 +28,29 @@ def get_commentary():
         end_date = request.args.get('end_date')
         
         if not currencies:
-            currencies = ['USD', 'EUR', 'GBP', 'JPY', 'INR', 'SGD', 'AUD', 'THB', 'TWD', 'KRW', 'HKD']
+            currencies = ALL_CURRENCIES
         
-        # Read commentary files directly
-        commentary_data = {}
         today = date.today().isoformat()
         
-        # Get the directory where commentary files are stored
-        script_dir = os.path.dirname(os.path.dirname(__file__))
-        
-        for currency in currencies:
-            try:
-                commentary_file = os.path.join(script_dir, f'{currency.lower()}_commentary.txt')
-                
-                if os.path.exists(commentary_file):
-                    with open(commentary_file, 'r') as f:
-                        commentary_text = f.read().strip()
+        def build_payload():
+            # Read commentary files directly
+            commentary_data = {}
+            
+            # Trade count and DV01 are extracted from the commentary text
+            for currency, parsed in collect_commentary(currencies).items():
+                if parsed['commentary_text']:
+                    if today not in commentary_data:
+                        commentary_data[today] = {}
                     
-                    if commentary_text:
-                        if today not in commentary_data:
-                            commentary_data[today] = {}
-                        
-                        # Count trades and calculate DV01 from commentary
-                        trade_count = commentary_text.count('traded')
-                        total_dv01 = 0
-                        
-                        # Extract DV01 values from commentary
-                        import re
-                        dv01_matches = re.findall(r'(\d+(?:\.\d+)?[kM]?)\s+DV01', commentary_text)
-                        for match in dv01_matches:
-                            try:
-                                if 'k' in match:
-                                    total_dv01 += float(match.replace('k', '')) * 1000
-                                elif 'M' in match:
-                                    total_dv01 += float(match.replace('M', '')) * 1000000
-                                else:
-                                    total_dv01 += float(match)
-                            except:
-                                continue
-                        
-                        commentary_data[today][currency] = {
-                            'commentary_text': commentary_text,
-                            'trade_count': trade_count,
-                            'total_dv01': total_dv01
-                        }
-                        
-            except Exception as e:
-                logger.warning(f"Error reading commentary for {currency}: {e}")
-                continue
+                    commentary_data[today][currency] = parsed
+            
+            return {
+                'success': True,
+                'data': commentary_data
+            }
         
-        return jsonify({
-            'success': True,
-            'data': commentary_data
-        })
+        # Reuses the serialized body while the files (and the date) are unchanged
+        return cached_json_response(('commentary', tuple(currencies), today), currencies, build_payload)
         
     except Exception as e:
         logger.error(f"Error getting commentary: {e}")
@@ -88,64 +60,34 @@ def get_commentary():
 def get_summary():
     """Get summary statistics"""
     try:
-        # Calculate summary from commentary files
-        script_dir = os.path.dirname(os.path.dirname(__file__))
-        currencies = ['USD', 'EUR', 'GBP', 'JPY', 'INR', 'SGD', 'AUD', 'THB', 'TWD', 'KRW', 'HKD']
-        
-        total_trades = 0
-        total_dv01 = 0
-        active_currencies = 0
-        by_currency = {}
-        
-        for currency in currencies:
-            try:
-                commentary_file = os.path.join(script_dir, f'{currency.lower()}_commentary.txt')
-                
-                if os.path.exists(commentary_file):
-                    with open(commentary_file, 'r') as f:
-                        commentary_text = f.read().strip()
-                    
-                    if commentary_text and 'traded' in commentary_text:
-                        active_currencies += 1
-                        
-                        # Count trades
-                        trade_count = commentary_text.count('traded')
-                        total_trades += trade_count
-                        
-                        # Extract DV01
-                        import re
-                        currency_dv01 = 0
-                        dv01_matches = re.findall(r'(\d+(?:\.\d+)?[kM]?)\s+DV01', commentary_text)
-                        for match in dv01_matches:
-                            try:
-                                if 'k' in match:
-                                    currency_dv01 += float(match.replace('k', '')) * 1000
-                                elif 'M' in match:
-                                    currency_dv01 += float(match.replace('M', '')) * 1000000
-                                else:
-                                    currency_dv01 += float(match)
-                            except:
-                                continue
-                        
-                        total_dv01 += currency_dv01
-                        by_currency[currency] = {
-                            'trade_count': trade_count,
-                            'total_dv01': currency_dv01
-                        }
-                        
-            except Exception as e:
-                logger.warning(f"Error processing summary for {currency}: {e}")
-                continue
-        
-        return jsonify({
-            'success': True,
-            'summary': {
-                'total_trades': total_trades,
-                'total_dv01': total_dv01,
-                'active_currencies': active_currencies,
-                'by_currency': by_currency
+        def build_payload():
+            # Calculate summary from commentary files
+            total_trades = 0
+            total_dv01 = 0
+            active_currencies = 0
+            by_currency = {}
+            
+            for currency, parsed in collect_commentary(ALL_CURRENCIES, with_text=False).items():
+                if parsed['trade_count']:
+                    active_currencies += 1
+                    total_trades += parsed['trade_count']
+                    total_dv01 += parsed['total_dv01']
+                    by_currency[currency] = {
+                        'trade_count': parsed['trade_count'],
+                        'total_dv01': parsed['total_dv01']
+                    }
+            
+            return {
+                'success': True,
+                'summary': {
+                    'total_trades': total_trades,
+                    'total_dv01': total_dv01,
+                    'active_currencies': active_currencies,
+                    'by_currency': by_currency
+                }
             }
-        })
+        
+        return cached_json_response(('summary',), ALL_CURRENCIES, build_payload)
         
     except Exception as e:
         logger.error(f"Error getting summary: {e}")
@@ -155,7 +97,7 @@ def get_summary():
 def get_currencies():
     """Get available currencies"""
     try:
-        currencies = ['USD', 'EUR', 'GBP', 'JPY', 'INR', 'SGD', 'AUD', 'THB', 'TWD', 'KRW', 'HKD']
+        currencies = list(ALL_CURRENCIES)
         return jsonify({
             'success': True,
             'currencies': currencies
@@ -189,23 +131,23 @@ def get_status():
         scheduler_status = scheduler.get_status() if scheduler else {'running': False}
         
         # Check if commentary files exist and get their timestamps
-        script_dir = os.path.dirname(os.path.dirname(__file__))
         recent_logs = []
         
         # Check for recent analysis files
-        for currency in ['usd', 'eur', 'gbp', 'jpy']:
-            commentary_file = os.path.join(script_dir, f'{currency}_commentary.txt')
-            if os.path.exists(commentary_file):
-                stat = os.stat(commentary_file)
-                recent_logs.append({
-                    'process_type': 'AUTOMATIC',
-                    'status': 'success',
-                    'run_timestamp': datetime.fromtimestamp(stat.st_mtime).isoformat(),
-                    'records_processed': 'Analysis completed',
-                    'execution_time_seconds': 0.1,
-                    'error_message': None
-                })
-                break  # Only need one timestamp
+        commentary_files = commentary_stats()
+        for currency in ('USD', 'EUR', 'GBP', 'JPY'):
+            stat = commentary_files.get(COMMENTARY_PATHS[currency])
+            if not stat:
+                continue
+            recent_logs.append({
+                'process_type': 'AUTOMATIC',
+                'status': 'success',
+                'run_timestamp': datetime.fromtimestamp(stat.st_mtime).isoformat(),
+                'records_processed': 'Analysis completed',
+                'execution_time_seconds': 0.1,
+                'error_message': None
+            })
+            break  # Only need one timestamp
         
         return jsonify({
             'success': True,
@@ -220,45 +162,68 @@ def get_status():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _run_with_scheduler(run, success_message, error_message):
+    """Run a scheduler method (True on success); the result reported by the job's status"""
+    if run():
+        return {
+            'success': True,
+            'message': success_message
+        }
+    else:
+        return {
+            'success': False,
+            'error': error_message
+        }
+
+def _run_scripts(script_dir, parser_path, analysis_path, success_message):
+    """Run DTCCParser.py (if given) then DTCCAnalysis.py; the result reported by the job's status"""
+    if parser_path:
+        subprocess.run(['python3', parser_path], cwd=script_dir, timeout=60)
+    
+    result = subprocess.run([
+        'python3', analysis_path
+    ], cwd=script_dir, capture_output=True, text=True, timeout=60)
+    
+    if result.returncode == 0:
+        return {
+            'success': True,
+            'message': success_message
+        }
+    else:
+        return {
+            'success': False,
+            'error': result.stderr
+        }
+
+def _queued(job_id):
+    """Response for a manual run handed to the background; poll /job/<job_id> for the outcome"""
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status': 'queued'
+    }), 202
+
 @api_bp.route('/manual-run', methods=['POST'])
 def manual_run():
-    """Manually trigger data analysis only"""
+    """Manually trigger data analysis only (runs in the background)"""
     try:
         from src.services.scheduler import get_scheduler
         
         scheduler = get_scheduler()
         if scheduler:
-            success = scheduler.run_analysis_only()
-            if success:
-                return jsonify({
-                    'success': True,
-                    'message': 'Manual analysis completed successfully'
-                })
-            else:
-                return jsonify({
-                    'success': False,
-                    'error': 'Analysis failed - check logs'
-                })
+            return _queued(submit_job(
+                _run_with_scheduler, scheduler.run_analysis_only,
+                'Manual analysis completed successfully', 'Analysis failed - check logs'
+            ))
         else:
             # Fallback to direct execution
             script_dir = os.path.dirname(os.path.dirname(__file__))
             script_path = os.path.join(script_dir, 'DTCCAnalysis.py')
             
             if os.path.exists(script_path):
-                result = subprocess.run([
-                    'python3', script_path
-                ], cwd=script_dir, capture_output=True, text=True, timeout=60)
-                
-                if result.returncode == 0:
-                    return jsonify({
-                        'success': True,
-                        'message': 'Analysis completed successfully'
-                    })
-                else:
-                    return jsonify({
-                        'success': False,
-                        'error': result.stderr
-                    })
+                return _queued(submit_job(
+                    _run_scripts, script_dir, None, script_path, 'Analysis completed successfully'
+                ))
             else:
                 return jsonify({
                     'success': False,
@@ -270,49 +235,28 @@ def manual_run():
 
 @api_bp.route('/manual-refresh', methods=['POST'])
 def manual_refresh():
-    """Force refresh - run both parser and analysis"""
+    """Force refresh - run both parser and analysis (in the background)"""
     try:
         from src.services.scheduler import get_scheduler
         
         scheduler = get_scheduler()
         if scheduler:
-            success = scheduler.run_manual()
-            if success:
-                return jsonify({
-                    'success': True,
-                    'message': '🔄 Force refresh completed - both data collection and analysis run successfully'
-                })
-            else:
-                return jsonify({
-                    'success': False,
-                    'error': 'Force refresh failed - check logs'
-                })
+            return _queued(submit_job(
+                _run_with_scheduler, scheduler.run_manual,
+                '🔄 Force refresh completed - both data collection and analysis run successfully',
+                'Force refresh failed - check logs'
+            ))
         else:
-            # Fallback to direct execution
+            # Fallback to direct execution: parser first, then analysis
             script_dir = os.path.dirname(os.path.dirname(__file__))
-            
-            # Run parser first
             parser_path = os.path.join(script_dir, 'DTCCParser.py')
-            if os.path.exists(parser_path):
-                subprocess.run(['python3', parser_path], cwd=script_dir, timeout=60)
-            
-            # Then run analysis
             analysis_path = os.path.join(script_dir, 'DTCCAnalysis.py')
+            
             if os.path.exists(analysis_path):
-                result = subprocess.run([
-                    'python3', analysis_path
-                ], cwd=script_dir, capture_output=True, text=True, timeout=60)
-                
-                if result.returncode == 0:
-                    return jsonify({
-                        'success': True,
-                        'message': 'Force refresh completed successfully'
-                    })
-                else:
-                    return jsonify({
-                        'success': False,
-                        'error': result.stderr
-                    })
+                return _queued(submit_job(
+                    _run_scripts, script_dir, parser_path if os.path.exists(parser_path) else None,
+                    analysis_path, 'Force refresh completed successfully'
+                ))
             else:
                 return jsonify({
                     'success': False,
@@ -322,3 +266,10 @@ def manual_refresh():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@api_bp.route('/job/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Status of a queued manual run"""
+    status = job_status(job_id)
+    if status is None:
+        return jsonify({'success': False, 'error': 'Unknown job'}), 404
+    return jsonify({'success': True, 'job': status})
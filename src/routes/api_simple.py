@@ -4,6 +4,8 @@ import os
 import json
 import subprocess
 import logging
+from src.services.commentary_files import ALL_CURRENCIES, COMMENTARY_PATHS, collect_commentary, cached_json_response, commentary_stats
+from src.services.background_jobs import submit_job, job_status
 
 logger = logging.getLogger(__name__)
 
@@ -26,59 +28,29 @@ def get_commentary():
         end_date = request.args.get('end_date')
         
         if not currencies:
-            currencies = ['USD', 'EUR', 'GBP', 'JPY', 'INR', 'SGD', 'AUD', 'THB', 'TWD', 'KRW', 'HKD']
+            currencies = ALL_CURRENCIES
         
-        # Read commentary files directly
-        commentary_data = {}
         today = date.today().isoformat()
         
-        # Get the directory where commentary files are stored
-        script_dir = os.path.dirname(os.path.dirname(__file__))
-        
-        for currency in currencies:
-            try:
-                commentary_file = os.path.join(script_dir, f'{currency.lower()}_commentary.txt')
-                
-                if os.path.exists(commentary_file):
-                    with open(commentary_file, 'r') as f:
-                        commentary_text = f.read().strip()
+        def build_payload():
+            # Read commentary files directly
+            commentary_data = {}
+            
+            # Trade count and DV01 are extracted from the commentary text
+            for currency, parsed in collect_commentary(currencies).items():
+                if parsed['commentary_text']:
+                    if today not in commentary_data:
+                        commentary_data[today] = {}
                     
-                    if commentary_text:
-                        if today not in commentary_data:
-                            commentary_data[today] = {}
-                        
-                        # Count trades and calculate DV01 from commentary
-                        trade_count = commentary_text.count('traded')
-                        total_dv01 = 0
-                        
-                        # Extract DV01 values from commentary
-                        import re
-                        dv01_matches = re.findall(r'(\d+(?:\.\d+)?[kM]?)\s+DV01', commentary_text)
-                        for match in dv01_matches:
-                            try:
-                                if 'k' in match:
-                                    total_dv01 += float(match.replace('k', '')) * 1000
-                                elif 'M' in match:
-                                    total_dv01 += float(match.replace('M', '')) * 1000000
-                                else:
-                                    total_dv01 += float(match)
-                            except:
-                                continue
-                        
-                        commentary_data[today][currency] = {
-                            'commentary_text': commentary_text,
-                            'trade_count': trade_count,
-                            'total_dv01': total_dv01
-                        }
-                        
-            except Exception as e:
-                logger.warning(f"Error reading commentary for {currency}: {e}")
-                continue
+                    commentary_data[today][currency] = parsed
+            
+            return {
+                'success': True,
+                'data': commentary_data
+            }
         
-        return jsonify({
-            'success': True,
-            'data': commentary_data
-        })
+        # Reuses the serialized body while the files (and the date) are unchanged
+        return cached_json_response(('commentary', tuple(currencies), today), currencies, build_payload)
         
     except Exception as e:
         logger.error(f"Error getting commentary: {e}")
@@ -88,64 +60,34 @@ def get_commentary():
 def get_summary():
     """Get summary statistics"""
     try:
-        # Calculate summary from commentary files
-        script_dir = os.path.dirname(os.path.dirname(__file__))
-        currencies = ['USD', 'EUR', 'GBP', 'JPY', 'INR', 'SGD', 'AUD', 'THB', 'TWD', 'KRW', 'HKD']
-        
-        total_trades = 0
-        total_dv01 = 0
-        active_currencies = 0
-        by_currency = {}
-        
-        for currency in currencies:
-            try:
-                commentary_file = os.path.join(script_dir, f'{currency.lower()}_commentary.txt')
-                
-                if os.path.exists(commentary_file):
-                    with open(commentary_file, 'r') as f:
-                        commentary_text = f.read().strip()
-                    
-                    if commentary_text and 'traded' in commentary_text:
-                        active_currencies += 1
-                        
-                        # Count trades
-                        trade_count = commentary_text.count('traded')
-                        total_trades += trade_count
-                        
-                        # Extract DV01
-                        import re
-                        currency_dv01 = 0
-                        dv01_matches = re.findall(r'(\d+(?:\.\d+)?[kM]?)\s+DV01', commentary_text)
-                        for match in dv01_matches:
-                            try:
-                                if 'k' in match:
-                                    currency_dv01 += float(match.replace('k', '')) * 1000
-                                elif 'M' in match:
-                                    currency_dv01 += float(match.replace('M', '')) * 1000000
-                                else:
-                                    currency_dv01 += float(match)
-                            except:
-                                continue
-                        
-                        total_dv01 += currency_dv01
-                        by_currency[currency] = {
-                            'trade_count': trade_count,
-                            'total_dv01': currency_dv01
-                        }
-                        
-            except Exception as e:
-                logger.warning(f"Error processing summary for {currency}: {e}")
-                continue
-        
-        return jsonify({
-            'success': True,
-            'summary': {
-                'total_trades': total_trades,
-                'total_dv01': total_dv01,
-                'active_currencies': active_currencies,
-                'by_currency': by_currency
+        def build_payload():
+            # Calculate summary from commentary files
+            total_trades = 0
+            total_dv01 = 0
+            active_currencies = 0
+            by_currency = {}
+            
+            for currency, parsed in collect_commentary(ALL_CURRENCIES, with_text=False).items():
+                if parsed['trade_count']:
+                    active_currencies += 1
+                    total_trades += parsed['trade_count']
+                    total_dv01 += parsed['total_dv01']
+                    by_currency[currency] = {
+                        'trade_count': parsed['trade_count'],
+                        'total_dv01': parsed['total_dv01']
+                    }
+            
+            return {
+                'success': True,
+                'summary': {
+                    'total_trades': total_trades,
+                    'total_dv01': total_dv01,
+                    'active_currencies': active_currencies,
+                    'by_currency': by_currency
+                }
             }
-        })
+        
+        return cached_json_response(('summary',), ALL_CURRENCIES, build_payload)
         
     except Exception as e:
         logger.error(f"Error getting summary: {e}")
@@ -155,7 +97,7 @@ def get_summary():
 def get_currencies():
     """Get available currencies"""
     try:
-        currencies = ['USD', 'EUR', 'GBP', 'JPY', 'INR', 'SGD', 'AUD', 'THB', 'TWD', 'KRW', 'HKD']
+        currencies = list(ALL_CURRENCIES)
         return jsonify({
             'success': True,
             'currencies': currencies
@@ -183,13 +125,11 @@ def get_status():
     """Get processing status"""
     try:
         # Check if commentary files exist
-        script_dir = os.path.dirname(os.path.dirname(__file__))
         recent_logs = []
         
         # Check for recent analysis
-        usd_file = os.path.join(script_dir, 'usd_commentary.txt')
-        if os.path.exists(usd_file):
-            stat = os.stat(usd_file)
+        stat = commentary_stats().get(COMMENTARY_PATHS['USD'])
+        if stat:
             recent_logs.append({
                 'process_type': 'analysis',
                 'status': 'success',
@@ -210,67 +150,64 @@ def get_status():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _run_analysis_script(script_dir, script_path, success_message):
+    """Run DTCCAnalysis.py to completion; the result reported by the job's status"""
+    result = subprocess.run([
+        'python3', script_path
+    ], cwd=script_dir, capture_output=True, text=True, timeout=60)
+    
+    if result.returncode == 0:
+        return {
+            'success': True,
+            'message': success_message
+        }
+    else:
+        return {
+            'success': False,
+            'error': result.stderr
+        }
+
+def _queue_analysis(success_message):
+    """Queue a DTCCAnalysis.py run and respond with its job id; poll /job/<job_id> for the outcome"""
+    script_dir = os.path.dirname(os.path.dirname(__file__))
+    script_path = os.path.join(script_dir, 'DTCCAnalysis.py')
+    
+    if os.path.exists(script_path):
+        job_id = submit_job(_run_analysis_script, script_dir, script_path, success_message)
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status': 'queued'
+        }), 202
+    else:
+        return jsonify({
+            'success': False,
+            'error': 'DTCCAnalysis.py not found'
+        })
+
 @api_bp.route('/manual-run', methods=['POST'])
 def manual_run():
-    """Manually trigger data analysis"""
+    """Manually trigger data analysis (runs in the background)"""
     try:
-        # Run DTCCAnalysis.py directly
-        script_dir = os.path.dirname(os.path.dirname(__file__))
-        script_path = os.path.join(script_dir, 'DTCCAnalysis.py')
-        
-        if os.path.exists(script_path):
-            result = subprocess.run([
-                'python3', script_path
-            ], cwd=script_dir, capture_output=True, text=True, timeout=60)
-            
-            if result.returncode == 0:
-                return jsonify({
-                    'success': True,
-                    'message': 'Analysis completed successfully'
-                })
-            else:
-                return jsonify({
-                    'success': False,
-                    'error': result.stderr
-                })
-        else:
-            return jsonify({
-                'success': False,
-                'error': 'DTCCAnalysis.py not found'
-            })
+        return _queue_analysis('Analysis completed successfully')
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @api_bp.route('/manual-refresh', methods=['POST'])
 def manual_refresh():
-    """Force refresh - run analysis and reload"""
+    """Force refresh - run analysis in the background and reload"""
     try:
-        # Run DTCCAnalysis.py directly
-        script_dir = os.path.dirname(os.path.dirname(__file__))
-        script_path = os.path.join(script_dir, 'DTCCAnalysis.py')
-        
-        if os.path.exists(script_path):
-            result = subprocess.run([
-                'python3', script_path
-            ], cwd=script_dir, capture_output=True, text=True, timeout=60)
-            
-            if result.returncode == 0:
-                return jsonify({
-                    'success': True,
-                    'message': 'Force refresh completed - analysis run successfully'
-                })
-            else:
-                return jsonify({
-                    'success': False,
-                    'error': result.stderr
-                })
-        else:
-            return jsonify({
-                'success': False,
-                'error': 'DTCCAnalysis.py not found'
-            })
+        return _queue_analysis('Force refresh completed - analysis run successfully')
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@api_bp.route('/job/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Status of a queued manual run"""
+    status = job_status(job_id)
+    if status is None:
+        return jsonify({'success': False, 'error': 'Unknown job'}), 404
+    return jsonify({'success': True, 'job': status})
+
@@ -0,0 +1,46 @@
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Manual runs execute here instead of on the request thread; two at most so a
+# burst of clicks can't start a pile of parser/analysis processes
+MAX_CONCURRENT_JOBS = 2
+_JOB_POOL = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_JOBS, thread_name_prefix='manual-job')
+
+# job id -> Future; finished jobs beyond MAX_TRACKED_JOBS are forgotten, oldest first
+MAX_TRACKED_JOBS = 100
+_JOBS = {}
+_JOBS_LOCK = threading.Lock()
+
+def submit_job(fn, *args):
+    """Run fn(*args) in the background and return the new job's id.
+
+    fn should return a JSON-serializable result; it is reported by job_status()
+    once the job is done.
+    """
+    job_id = uuid.uuid4().hex
+    with _JOBS_LOCK:
+        finished = [known_id for known_id, future in _JOBS.items() if future.done()]
+        for known_id in finished[:max(0, len(_JOBS) - MAX_TRACKED_JOBS + 1)]:
+            del _JOBS[known_id]
+        _JOBS[job_id] = _JOB_POOL.submit(fn, *args)
+    logger.info(f"Queued background job {job_id}")
+    return job_id
+
+def job_status(job_id):
+    """{'job_id', 'status', ...} of a submitted job, or None for an unknown id.
+
+    status is 'queued', 'running', 'done' (with 'result') or 'error' (with 'error').
+    """
+    future = _JOBS.get(job_id)
+    if future is None:
+        return None
+    if not future.done():
+        return {'job_id': job_id, 'status': 'running' if future.running() else 'queued'}
+    error = future.exception()
+    if error is not None:
+        return {'job_id': job_id, 'status': 'error', 'error': str(error)}
+    return {'job_id': job_id, 'status': 'done', 'result': future.result()}
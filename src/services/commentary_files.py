@@ -0,0 +1,159 @@
+import os
+import re
+import time
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Commentary files live in src/; their paths are built once at import
+COMMENTARY_DIR = os.path.dirname(os.path.dirname(__file__))
+ALL_CURRENCIES = ('USD', 'EUR', 'GBP', 'JPY', 'INR', 'SGD', 'AUD', 'THB', 'TWD', 'KRW', 'HKD')
+COMMENTARY_PATHS = {
+    currency: os.path.join(COMMENTARY_DIR, f'{currency.lower()}_commentary.txt') for currency in ALL_CURRENCIES
+}
+
+def commentary_path(currency):
+    """Path of a currency's commentary file (precomputed for ALL_CURRENCIES)"""
+    return COMMENTARY_PATHS.get(currency) or os.path.join(COMMENTARY_DIR, f'{currency.lower()}_commentary.txt')
+
+# One scan for both "traded" (one per trade) and DV01 amounts, e.g. "1.2k DV01" -> ('1.2', 'k')
+# (bytes pattern, scanned over the file's raw contents)
+_COMMENTARY_RE = re.compile(rb'(traded)|(\d+(?:\.\d+)?)([kM]?)\s+DV01')
+_DV01_MULTIPLIERS = {b'': 1.0, b'k': 1e3, b'M': 1e6}
+
+def _scan_commentary(commentary):
+    """Trade count and total of all DV01 amounts mentioned in a commentary (bytes)"""
+    trade_count = 0
+    total_dv01 = 0
+    # finditer streams the matches instead of building a list of tuples first
+    for match in _COMMENTARY_RE.finditer(commentary):
+        if match.lastindex == 1:
+            trade_count += 1
+        else:
+            total_dv01 += float(match[2]) * _DV01_MULTIPLIERS[match[3]]
+    return trade_count, total_dv01
+
+# path -> (mtime_ns, size, parsed commentary, raw bytes)
+_PARSE_CACHE = {}
+
+def parse_commentary(path, stat=None, with_text=False):
+    """Scan a commentary file for its trade count and DV01 total.
+    
+    Results are cached until the file's mtime or size changes. Returns None if
+    the file does not exist. Pass stat to reuse an os.stat result already at hand.
+    The decoded commentary_text is only added (and then cached) when with_text is set;
+    it is decoded from the same read as the counts, so both describe one file version.
+    """
+    if stat is None:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+    
+    cached = _PARSE_CACHE.get(path)
+    if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        parsed, raw = cached[2], cached[3]
+    else:
+        # One plain read rather than mmap: DTCCAnalysis rewrites these files in place, and
+        # touching a mapping of a file truncated underneath it raises SIGBUS
+        with open(path, 'rb') as f:
+            raw = f.read()
+        trade_count, total_dv01 = _scan_commentary(raw)
+        parsed = {
+            'trade_count': trade_count,
+            'total_dv01': total_dv01
+        }
+        _PARSE_CACHE[path] = (stat.st_mtime_ns, stat.st_size, parsed, raw)
+    
+    if with_text and 'commentary_text' not in parsed:
+        parsed['commentary_text'] = raw.decode('utf-8').strip()
+    return parsed
+
+# Commentary files are read in parallel; file reads release the GIL
+MAX_COMMENTARY_READERS = 8
+_IO_POOL = ThreadPoolExecutor(max_workers=MAX_COMMENTARY_READERS, thread_name_prefix='commentary-io')
+
+# Seconds a listing of COMMENTARY_DIR is reused before the directory is read again
+SNAPSHOT_TTL = 1.0
+# (monotonic time taken, {path: stat_result})
+_snapshot = (float('-inf'), {})
+
+def commentary_stats():
+    """stat() of every *_commentary.txt in COMMENTARY_DIR, by path.
+
+    One os.scandir() listing replaces a stat() per file and is shared by all
+    endpoints for SNAPSHOT_TTL seconds; files missing from it don't exist.
+    """
+    global _snapshot
+    taken, stats = _snapshot
+    now = time.monotonic()
+    if now - taken >= SNAPSHOT_TTL:
+        with os.scandir(COMMENTARY_DIR) as entries:
+            stats = {
+                entry.path: entry.stat() for entry in entries if entry.name.endswith('_commentary.txt')
+            }
+        _snapshot = (now, stats)
+    return stats
+
+def collect_commentary(currencies, with_text=True):
+    """Parsed commentary files, by currency.
+
+    Each value is {'trade_count', 'total_dv01'} plus 'commentary_text' when with_text
+    is set; currencies without a readable file are left out. Shared by the
+    /commentary and /summary endpoints.
+    """
+    stats = commentary_stats()
+    # Start every file read at once, then collect in currency order
+    loads = {}
+    for currency in currencies:
+        path = commentary_path(currency)
+        stat = stats.get(path)
+        if stat is not None:
+            loads[currency] = _IO_POOL.submit(parse_commentary, path, stat, with_text)
+
+    collected = {}
+    for currency, load in loads.items():
+        try:
+            collected[currency] = dict(load.result())
+        except Exception as e:
+            logger.warning(f"Error reading commentary for {currency}: {e}")
+    return collected
+
+# (endpoint key) -> (etag, serialized JSON body) of the last response built from the files
+_RESPONSE_CACHE = {}
+# Seconds clients may reuse a commentary response before revalidating with its ETag
+RESPONSE_MAX_AGE = 30
+
+def cached_json_response(cache_key, currencies, build_payload):
+    """JSON response for payloads derived only from the given currencies' commentary files.
+
+    The ETag covers cache_key plus each file's (mtime_ns, size), so a matching
+    If-None-Match gets a 304 and an unchanged file set reuses the serialized body
+    without parsing or encoding anything.
+    """
+    from flask import current_app, request
+
+    stats = commentary_stats()
+    signature = []
+    for currency in currencies:
+        stat = stats.get(commentary_path(currency))
+        if stat:
+            signature.append((currency, stat.st_mtime_ns, stat.st_size))
+        else:
+            signature.append((currency, None, None))
+    etag = hashlib.md5(repr((cache_key, signature)).encode()).hexdigest()
+
+    cached = _RESPONSE_CACHE.get(cache_key)
+    if cached and cached[0] == etag:
+        response = current_app.response_class(cached[1], mimetype='application/json')
+    else:
+        response = current_app.json.response(build_payload())
+        if len(_RESPONSE_CACHE) >= 64:  # keys include request parameters; keep the cache bounded
+            _RESPONSE_CACHE.clear()
+        _RESPONSE_CACHE[cache_key] = (etag, response.get_data())
+
+    response.set_etag(etag)
+    response.cache_control.max_age = RESPONSE_MAX_AGE
+    return response.make_conditional(request)
@@ -1,30 +1,64 @@
 import os
 import sys
-import pandas as pd
+import csv
 import json
 import logging
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 from typing import Dict, List, Optional
 import threading
 import time
 import traceback
+from collections import defaultdict
+from functools import lru_cache
 
 # Add src to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from src.models.trade_data import db, TradeRecord, StructuredTrade, Commentary, ProcessingLog
-from src.DTCCParser import fetch_trade_data, process_trades, get_existing_trade_timestamps
-from src.DTCCAnalysis import DTCCAnalysis
+from src.models.trade_data import db, bulk_insert, bulk_insert_ignore_duplicates, TradeRecord, StructuredTrade, Commentary, ProcessingLog, first_dv01
+from src.DTCCParser import fetch_trade_data, process_trades, save_validators
+from sqlalchemy import select
+
+# TradeRecord attribute -> header of the debug trade_data.csv export
+TRADE_CSV_COLUMNS = [
+    ('trade_time', 'Trade Time'),
+    ('effective_date', 'Effective Date'),
+    ('expiration_date', 'Expiration Date'),
+    ('tenor', 'Tenor'),
+    ('currency', 'Currency'),
+    ('rates', 'Rates'),
+    ('notionals', 'Notionals'),
+    ('dv01', 'Dv01'),
+    ('frequency', 'Frequency'),
+    ('action_type', 'Action Type'),
+    ('event_type', 'Event Type'),
+    ('asset_class', 'Asset Class'),
+    ('upi_underlier_name', 'UPI Underlier Name'),
+    ('unique_product_identifier', 'Unique Product Identifier'),
+    ('dissemination_identifier', 'Dissemination Identifier'),
+    ('other_payment_type', 'Other Payment Type'),
+    ('created_at', 'Created At'),
+]
+
+@lru_cache(maxsize=4096)
+def _parse_date(value):
+    """pd.to_datetime(value).date(), memoized: a batch of trades shares few distinct dates"""
+    import pandas as pd
+    return pd.to_datetime(value).date()
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Only the process holding this lock runs the background loop, so several web
+# workers (e.g. gunicorn --workers=N) don't all fetch and write at once
+RUNNER_LOCK_NAME = 'dtcc_data_processor.lock'
+
 class DataProcessor:
     def __init__(self, app):
         self.app = app
         self.running = False
         self.thread = None
+        self._lock_file = None
         
     def start_background_processing(self):
         """Start the background processing thread"""
@@ -41,8 +75,33 @@ class DataProcessor:
             self.thread.join()
         logger.info("Background processing stopped")
     
+    def _acquire_runner_lock(self):
+        """Wait until this process is the single runner; False if stopped while waiting"""
+        try:
+            import fcntl
+        except ImportError:
+            return True  # No flock on this platform; run unguarded as before
+        
+        from src.paths import tmp_dir
+        self._lock_file = open(tmp_dir() / RUNNER_LOCK_NAME, 'w')
+        logged = False
+        while self.running:
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                if not logged:
+                    logger.info("Background processing already runs in another process, standing by")
+                    logged = True
+                time.sleep(5)
+        return False
+    
     def _background_loop(self):
         """Main background processing loop - runs every minute"""
+        # The lock is held until this process exits; a standby takes over then
+        if not self._acquire_runner_lock():
+            return
+        
         while self.running:
             try:
                 with self.app.app_context():
@@ -63,6 +122,7 @@ class DataProcessor:
     
     def run_data_collection(self):
         """Run DTCC data collection and store in database"""
+        import pandas as pd
         start_time = time.time()
         
         # Log database connection details
@@ -84,7 +144,7 @@ class DataProcessor:
             logger.info("Starting DTCC data collection...")
             
             # Fetch data from DTCC API
-            json_data = fetch_trade_data()
+            json_data, validators = fetch_trade_data()
             if not json_data or 'tradeList' not in json_data:
                 raise Exception("No trade data fetched or 'tradeList' not found in response")
             
@@ -97,17 +157,16 @@ class DataProcessor:
                 log_entry.records_processed = 0
                 log_entry.execution_time_seconds = time.time() - start_time
                 db.session.commit()
+                save_validators(validators)
                 return
             
-            # Get existing dissemination identifiers to avoid duplicates
-            existing_dissemination_ids = self._get_existing_dissemination_ids_from_db()
-            
-            # Process trades and handle corrections
+            # Process trades and handle corrections. Trades already stored are skipped by
+            # the unique dissemination_identifier index when inserting.
             new_trades = []
             trades_to_delete = []
             
             for trade in processed_trades:
-                dissemination_id = trade.get('Dissemination Identifier', '')
+                dissemination_id = trade.get('Dissemination Identifier') or None
                 original_dissemination_id = trade.get('Original Dissemination Identifier', '')
                 
                 if not dissemination_id:
@@ -115,21 +174,21 @@ class DataProcessor:
                 
                 # Check if this is a correction (has originalDisseminationIdentifier)
                 if original_dissemination_id:
-                    # This is a correction - find and mark original trade for deletion
-                    if original_dissemination_id in existing_dissemination_ids:
-                        trades_to_delete.append(original_dissemination_id)
-                        logger.info(f"Found correction: will replace trade {original_dissemination_id} with {dissemination_id}")
-                else:
-                    # This is a new trade - check for uniqueness
-                    if dissemination_id in existing_dissemination_ids:
-                        logger.info(f"Trade {dissemination_id} already exists, skipping")
-                        continue
+                    # This is a correction - mark original trade for deletion
+                    trades_to_delete.append(original_dissemination_id)
                 
                 # Add this trade (whether new or correction)
                 new_trades.append(trade)
             
-            # Delete corrected trades from database
+            # Delete corrected trades from database; only originals actually stored need a
+            # DELETE (a correction fetched again finds its original already gone)
             if trades_to_delete:
+                trades_to_delete = db.session.scalars(
+                    select(TradeRecord.dissemination_identifier)
+                    .where(TradeRecord.dissemination_identifier.in_(trades_to_delete))
+                ).all()
+            if trades_to_delete:
+                logger.info(f"Found corrections: will replace trades {', '.join(trades_to_delete)}")
                 deleted_count = TradeRecord.query.filter(
                     TradeRecord.dissemination_identifier.in_(trades_to_delete)
                 ).delete(synchronize_session=False)
@@ -137,13 +196,13 @@ class DataProcessor:
                 logger.info(f"Deleted {deleted_count} corrected trades from database")
             
             # Store new trades in database
-            records_added = 0
+            trade_rows = []
             for trade in new_trades:
                 try:
-                    trade_record = TradeRecord(
+                    trade_rows.append(dict(
                         trade_time=pd.to_datetime(trade.get('Trade Time')),
-                        effective_date=pd.to_datetime(trade.get('Effective Date')).date(),
-                        expiration_date=pd.to_datetime(trade.get('Expiration Date')).date() if trade.get('Expiration Date') else None,
+                        effective_date=_parse_date(trade.get('Effective Date')),
+                        expiration_date=_parse_date(trade.get('Expiration Date')) if trade.get('Expiration Date') else None,
                         tenor=float(trade.get('Tenor')) if trade.get('Tenor') and trade.get('Tenor') != '' else None,
                         currency=trade.get('Currency', ''),
                         rates=float(trade.get('Rates')) if trade.get('Rates') and trade.get('Rates') != '' else None,
@@ -155,16 +214,17 @@ class DataProcessor:
                         asset_class=trade.get('Asset Class', ''),
                         upi_underlier_name=trade.get('UPI Underlier Name', ''),
                         unique_product_identifier=trade.get('Unique Product Identifier', ''),
-                        dissemination_identifier=trade.get('Dissemination Identifier', ''),
+                        # NULL, not '', when missing: the unique index treats every '' as the same ID
+                        dissemination_identifier=trade.get('Dissemination Identifier') or None,
                         other_payment_type=trade.get('Other Payment Type', '')
-                    )
-                    db.session.add(trade_record)
-                    records_added += 1
+                    ))
                 except Exception as e:
                     logger.warning(f"Error processing trade record: {e}")
                     continue
             
-            db.session.commit()
+            records_added = bulk_insert_ignore_duplicates(TradeRecord, trade_rows, ['dissemination_identifier'])
+            if records_added < len(trade_rows):
+                logger.info(f"Skipped {len(trade_rows) - records_added} trades that already exist")
             
             # Export all trade data to CSV for debugging
             self._export_trade_data_to_csv()
@@ -174,6 +234,8 @@ class DataProcessor:
             log_entry.records_processed = records_added
             log_entry.execution_time_seconds = time.time() - start_time
             db.session.commit()
+            # Only now that the trades are committed may the next fetch get a 304 for this payload
+            save_validators(validators)
             
             logger.info(f"Data collection completed: {records_added} new trades added")
             
@@ -191,6 +253,10 @@ class DataProcessor:
     
     def run_data_analysis(self):
         """Run DTCC data analysis and store results"""
+        # pandas and the analyzer are imported on first run rather than at
+        # app boot, keeping them off the web process's startup path
+        import pandas as pd
+        from src.DTCCAnalysis import DTCCAnalysis
         start_time = time.time()
         log_entry = ProcessingLog(
             process_type='analysis',
@@ -262,43 +328,53 @@ class DataProcessor:
             # Clear existing structured trades for today
             StructuredTrade.query.filter(StructuredTrade.analysis_date == today).delete()
             
-            # Store structured trades
-            records_added = 0
+            # Store structured trades (one batched insert, committed with the commentary below)
+            structured_rows = []
             for structured_trade in analyzer.structured_output:
                 try:
-                    trade_record = StructuredTrade(
+                    dv01s = str(analyzer.format_legs(structured_trade['DV01s']))
+                    structured_rows.append(dict(
                         trade_time=pd.to_datetime(structured_trade['Trade Time']),
                         structure=structured_trade['Structure'],
                         start_date=structured_trade['Start Date'],
                         currency=structured_trade['Currency'],
                         tenors=structured_trade['Tenors'],
-                        rates=str(structured_trade['Rates']),
-                        notionals=str(structured_trade['Notionals']),
-                        dv01s=str(structured_trade['DV01s']),
+                        rates=str(analyzer.format_legs(structured_trade['Rates'])),
+                        notionals=str(analyzer.format_legs(structured_trade['Notionals'])),
+                        dv01s=dv01s,
+                        first_dv01=first_dv01(dv01s),
                         package_price=structured_trade.get('Package Price', ''),
                         other_pay_types=structured_trade.get('Other Pay Types', ''),
                         metric_bps=float(structured_trade['Metric (bps)']) if structured_trade['Metric (bps)'] != '' else None,
                         expiration=pd.to_datetime(structured_trade['Expiration']).date() if structured_trade.get('Expiration') else None,
                         analysis_date=today
-                    )
-                    db.session.add(trade_record)
-                    records_added += 1
+                    ))
                 except Exception as e:
                     logger.warning(f"Error processing structured trade: {e}")
                     continue
+            records_added = bulk_insert(StructuredTrade, structured_rows, commit=False)
             
             # Generate and store commentary for each currency
             currencies = ['USD', 'EUR', 'GBP', 'JPY', 'INR', 'SGD', 'AUD', 'THB', 'TWD', 'KRW', 'HKD']
+            
+            # Bucket structured trades by currency once instead of rescanning per currency
+            trades_by_currency = defaultdict(list)
+            for structured_trade in analyzer.structured_output:
+                trades_by_currency[structured_trade['Currency']].append(structured_trade)
             for currency in currencies:
                 try:
                     commentary_text = analyzer.generate_commentary(currency)
                     
                     # Calculate summary statistics
-                    currency_trades = [t for t in analyzer.structured_output if t['Currency'] == currency]
+                    currency_trades = trades_by_currency[currency]
                     trade_count = len(currency_trades)
                     
                     if trade_count > 0:
-                        total_dv01 = sum(float(str(t['DV01s']).split(',')[0]) for t in currency_trades if t['DV01s'])
+                        # Package DV01s are per-leg tuples; count the first leg as before
+                        total_dv01 = sum(
+                            float(t['DV01s'][0] if isinstance(t['DV01s'], tuple) else t['DV01s'])
+                            for t in currency_trades if t['DV01s']
+                        )
                         structures_summary = {}
                         for trade in currency_trades:
                             structure = trade['Structure']
@@ -361,18 +437,9 @@ class DataProcessor:
                 logger.error(f"Error committing log entry: {commit_error}")
                 db.session.rollback()
     
-    def _get_existing_trade_timestamps_from_db(self):
-        """Get existing trade timestamps from database"""
-        existing_records = TradeRecord.query.with_entities(TradeRecord.trade_time).all()
-        return {record.trade_time.isoformat() for record in existing_records}
-    
-    def _get_existing_dissemination_ids_from_db(self):
-        """Get existing dissemination identifiers from database"""
-        existing_records = TradeRecord.query.with_entities(TradeRecord.dissemination_identifier).all()
-        return {record.dissemination_identifier for record in existing_records if record.dissemination_identifier}
-    
     def _clean_numeric_value(self, value):
         """Clean numeric values for database storage"""
+        import pandas as pd
         if pd.isna(value) or value == '' or value is None:
             return None
         
@@ -398,7 +465,7 @@ class DataProcessor:
             commentaries = Commentary.query.filter(
                 Commentary.currency.in_(currencies),
                 Commentary.analysis_date >= start_dt,
-                Commentary.analysis_date <= end_dt
+                Commentary.analysis_date < end_dt + timedelta(days=1)
             ).order_by(Commentary.analysis_date.desc(), Commentary.currency).all()
             
             result = {}
@@ -432,44 +499,30 @@ class DataProcessor:
     def _export_trade_data_to_csv(self):
         """Export all trade data from database to CSV for debugging"""
         try:
-            # Get all trade records from database
-            trade_records = TradeRecord.query.order_by(TradeRecord.trade_time.desc()).all()
+            columns = [getattr(TradeRecord, attr) for attr, _ in TRADE_CSV_COLUMNS]
+            stmt = select(*columns).order_by(TradeRecord.trade_time.desc())
+            result = db.session.execute(stmt.execution_options(stream_results=True, yield_per=10_000))
+            
+            from src.paths import data_dir
+            csv_path = data_dir() / 'trade_data.csv'
+            
+            # Stream rows straight into csv.writer; dates keep their ISO format
+            exported = 0
+            with open(csv_path, 'w', newline='', buffering=1 << 20) as f:
+                writer = csv.writer(f)
+                writer.writerow([header for _, header in TRADE_CSV_COLUMNS])
+                for partition in result.partitions():
+                    writer.writerows(
+                        [value.isoformat() if isinstance(value, (datetime, date)) else value for value in row]
+                        for row in partition
+                    )
+                    exported += len(partition)
             
-            if not trade_records:
+            if not exported:
                 logger.info("No trade records to export")
                 return
             
-            # Convert to list of dictionaries
-            trade_data = []
-            for record in trade_records:
-                trade_data.append({
-                    'Trade Time': record.trade_time.isoformat() if record.trade_time else '',
-                    'Effective Date': record.effective_date.isoformat() if record.effective_date else '',
-                    'Expiration Date': record.expiration_date.isoformat() if record.expiration_date else '',
-                    'Tenor': record.tenor,
-                    'Currency': record.currency,
-                    'Rates': record.rates,
-                    'Notionals': record.notionals,
-                    'Dv01': record.dv01,
-                    'Frequency': record.frequency,
-                    'Action Type': record.action_type,
-                    'Event Type': record.event_type,
-                    'Asset Class': record.asset_class,
-                    'UPI Underlier Name': record.upi_underlier_name,
-                    'Unique Product Identifier': record.unique_product_identifier,
-                    'Dissemination Identifier': record.dissemination_identifier,
-                    'Other Payment Type': record.other_payment_type,
-                    'Created At': record.created_at.isoformat() if record.created_at else ''
-                })
-            
-            # Create DataFrame and save to CSV
-            df = pd.DataFrame(trade_data)
-            from src.paths import DATA_DIR
-            csv_path = DATA_DIR / 'trade_data.csv'
-            df.to_csv(csv_path, index=False)
-            
-            logger.info(f"Exported {len(trade_records)} trade records to {csv_path}")
+            logger.info(f"Exported {exported} trade records to {csv_path}")
             
         except Exception as e:
             logger.error(f"Error exporting trade data to CSV: {e}")
-
@@ -136,9 +136,10 @@ class DataProcessor:
                 reader = csv.DictReader(f)
                 for row in reader:
                     try:
-                        # Check if record already exists
-                        existing = TradeRecord.query.filter_by(
-                            dissemination_identifier=row.get('Dissemination Identifier', '')
+                        # Check if record already exists (rows without an ID are stored as NULL)
+                        dissemination_id = row.get('Dissemination Identifier') or None
+                        existing = dissemination_id and TradeRecord.query.filter_by(
+                            dissemination_identifier=dissemination_id
                         ).first()
                         
                         if not existing:
@@ -157,7 +158,7 @@ class DataProcessor:
                                 asset_class=row.get('Asset Class', ''),
                                 upi_underlier_name=row.get('UPI Underlier Name', ''),
                                 unique_product_identifier=row.get('Unique Product Identifier', ''),
-                                dissemination_identifier=row.get('Dissemination Identifier', ''),
+                                dissemination_identifier=dissemination_id,
                                 other_payment_type=row.get('Other Payment Type', '')
                             )
                             db.session.add(trade_record)
@@ -75,13 +75,14 @@ class MCPQueryProcessor:
             from flask import current_app
             
             start_datetime = datetime.combine(start_date, datetime.min.time())
-            end_datetime = datetime.combine(end_date, datetime.max.time())
+            # Half-open range: everything before midnight after end_date
+            end_datetime = datetime.combine(end_date + timedelta(days=1), datetime.min.time())
             
             # Always use current_app context
             if current_app:
                 trades = TradeRecord.query.filter(
                     TradeRecord.created_at >= start_datetime,
-                    TradeRecord.created_at <= end_datetime,
+                    TradeRecord.created_at < end_datetime,
                     TradeRecord.dv01.isnot(None),
                     TradeRecord.dv01 > 0
                 ).all()